@@ -0,0 +1,440 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2019 Released under the MIT license
+# Created on 2019-03-15
+
+__updated__ = "2019-03-15"
+__version__ = "0.0"
+
+# Load benchmark of the mqtt app without hardware or external broker.
+# Starts an in-process MQTT 3.1.1 broker stand-in, the server with only the mqtt app (registry override,
+# no apps.yaml needed) and N simulated devices speaking the apphandler protocol over TCP.
+# Reports:
+# - broker -> device and device -> broker throughput and end-to-end latency percentiles
+# - threads and python memory per device (tracemalloc, includes the sockets of the simulated devices)
+# - recovery time after all devices reconnect at once and after the broker dropped all connections
+# Usage: python3 -m _testing.server.mqtt_bridge_benchmark [devices] [messages per device] [direct|bridge]
+#        [asyncio|paho]
+# Note: paho uses select(), which can't handle file descriptors >= 1024. Broker stand-in and simulated devices
+# run in the same process, so "direct paho" stops working at ~150 devices here (~250 on a real server).
+
+import asyncio
+import binascii
+import json
+import logging
+import struct
+import sys
+import threading
+import time
+import tracemalloc
+
+from server.apphandler import clients
+from server.apphandler.apphandler import AppHandler
+from server.apphandler.stats import Histogram
+from server.apps.mqtt.subscriptions import TopicTrie
+from server.server_generic import Network
+
+BROKER_PORT = 18883
+SERVER_PORT = 18884
+IDENT = 1  # mqtt app
+CMD_PUB = 1
+CMD_SUBS = 2
+TOPICS = 50  # topics per device used for broker -> device messages
+
+log = logging.getLogger("Benchmark")
+
+
+def _string(s) -> bytes:
+    s = s.encode() if type(s) == str else s
+    return struct.pack("!H", len(s)) + s
+
+
+def _matches(topic_filter, topic) -> bool:
+    trie = TopicTrie()
+    trie[topic_filter] = True
+    return any(True for _ in trie.iterMatch(topic))
+
+
+def _packet(header, body) -> bytes:
+    length = len(body)
+    remaining = bytearray()
+    while True:
+        b = length % 128
+        length //= 128
+        remaining.append(b | 0x80 if length > 0 else b)
+        if length == 0:
+            break
+    return bytes([header]) + remaining + body
+
+
+class Broker:
+    """
+    Minimal MQTT 3.1.1 broker: qos 0-2 from clients, qos 0 to subscribers, retained messages,
+    wills and persistent sessions (subscriptions only, no queueing).
+    """
+
+    def __init__(self):
+        self.subscriptions = TopicTrie()  # topic filter: {connection: qos}
+        self.sessions = {}  # client_id: {topic filter: qos} of persistent sessions
+        self.connections = set()
+        self.retained = {}
+        self.on_publish = None  # called with topic, payload of every publish
+        self.connects = 0
+        self.subscribes = 0
+        self.server = None
+
+    async def start(self, port):
+        self.server = await asyncio.get_event_loop().create_server(lambda: _BrokerConnection(self),
+                                                                   "127.0.0.1", port)
+
+    def stop(self):
+        self.server.close()
+        self.dropAll()
+
+    def dropAll(self):
+        """Close all connections like a broker restart"""
+        for connection in list(self.connections):
+            connection.transport.abort()
+
+    def publish(self, topic, payload, retain=False):
+        if self.on_publish is not None:
+            self.on_publish(topic, payload)
+        if retain:
+            if len(payload) > 0:
+                self.retained[topic] = payload
+            else:
+                self.retained.pop(topic, None)
+        packet = None
+        targets = set()
+        for topic_filter, subs in self.subscriptions.iterMatch(topic):
+            targets.update(subs)
+        for connection in targets:
+            if packet is None:
+                packet = _packet(0x30, _string(topic) + payload)
+            connection.transport.write(packet)
+
+    def subscribe(self, connection, topic_filter, qos):
+        subs = self.subscriptions.get(topic_filter)
+        if subs is None:
+            subs = self.subscriptions[topic_filter] = {}
+        subs[connection] = qos
+        connection.subs[topic_filter] = qos
+        for topic, payload in self.retained.items():
+            if _matches(topic_filter, topic):
+                connection.transport.write(_packet(0x31, _string(topic) + payload))
+
+    def unsubscribe(self, connection, topic_filter):
+        connection.subs.pop(topic_filter, None)
+        subs = self.subscriptions.get(topic_filter)
+        if subs is not None:
+            subs.pop(connection, None)
+            if len(subs) == 0:
+                del self.subscriptions[topic_filter]
+
+    def remove(self, connection):
+        self.connections.discard(connection)
+        for topic_filter in list(connection.subs):
+            subs = self.subscriptions.get(topic_filter)
+            if subs is not None:
+                subs.pop(connection, None)
+                if len(subs) == 0:
+                    del self.subscriptions[topic_filter]
+
+
+class _BrokerConnection(asyncio.Protocol):
+    def __init__(self, broker: Broker):
+        self.broker = broker
+        self.transport = None
+        self.buffer = bytearray()
+        self.client_id = None
+        self.subs = {}
+        self.will = None
+        self.clean = True
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.broker.connections.add(self)
+
+    def connection_lost(self, exc):
+        self.broker.remove(self)
+        if self.will is not None:
+            self.broker.publish(*self.will)
+
+    def data_received(self, data):
+        buf = self.buffer
+        buf += data
+        while len(buf) >= 2:
+            length = 0
+            multiplier = 1
+            i = 1
+            while True:
+                if i >= len(buf):
+                    return
+                b = buf[i]
+                length += (b & 0x7F) * multiplier
+                multiplier *= 128
+                i += 1
+                if b & 0x80 == 0:
+                    break
+            if len(buf) < i + length:
+                return
+            header = buf[0]
+            body = bytes(buf[i:i + length])
+            del buf[:i + length]
+            self.handle(header, body)
+
+    def _read(self, body, pos):
+        n = struct.unpack_from("!H", body, pos)[0]
+        return body[pos + 2:pos + 2 + n], pos + 2 + n
+
+    def handle(self, header, body):
+        packet_type = header & 0xF0
+        if packet_type == 0x10:  # CONNECT
+            self.broker.connects += 1
+            flags = body[7]
+            client_id, pos = self._read(body, 10)
+            self.client_id = client_id.decode()
+            self.clean = bool(flags & 0x02)
+            if flags & 0x04:
+                topic, pos = self._read(body, pos)
+                message, pos = self._read(body, pos)
+                self.will = (topic.decode(), message, bool(flags & 0x20))
+            session_present = 0
+            if self.clean:
+                self.broker.sessions.pop(self.client_id, None)
+            elif self.client_id in self.broker.sessions:
+                session_present = 1
+                for topic_filter, qos in self.broker.sessions[self.client_id].items():
+                    self.broker.subscribe(self, topic_filter, qos)
+            if not self.clean:
+                self.broker.sessions[self.client_id] = self.subs
+            self.transport.write(_packet(0x20, bytes([session_present, 0])))
+        elif packet_type == 0x30:  # PUBLISH
+            qos = (header >> 1) & 0x03
+            topic, pos = self._read(body, 0)
+            if qos > 0:
+                mid = body[pos:pos + 2]
+                pos += 2
+                self.transport.write(_packet(0x40 if qos == 1 else 0x50, mid))
+            self.broker.publish(topic.decode(), body[pos:], bool(header & 0x01))
+        elif packet_type == 0x60:  # PUBREL
+            self.transport.write(_packet(0x70, body))
+        elif packet_type == 0x80:  # SUBSCRIBE
+            self.broker.subscribes += 1
+            pos = 2
+            rc = b""
+            while pos < len(body):
+                topic_filter, pos = self._read(body, pos)
+                qos = body[pos]
+                pos += 1
+                self.broker.subscribe(self, topic_filter.decode(), qos)
+                rc += b"\x00"
+            self.transport.write(_packet(0x90, body[:2] + rc))
+        elif packet_type == 0xA0:  # UNSUBSCRIBE
+            pos = 2
+            while pos < len(body):
+                topic_filter, pos = self._read(body, pos)
+                self.broker.unsubscribe(self, topic_filter.decode())
+            self.transport.write(_packet(0xB0, body[:2]))
+        elif packet_type == 0xC0:  # PINGREQ
+            self.transport.write(_packet(0xD0, b""))
+        elif packet_type == 0xE0:  # DISCONNECT
+            self.will = None
+            self.transport.close()
+
+
+class SimDevice:
+    """Device using the mqtt app, speaks the line protocol of the acks_header_clients"""
+
+    def __init__(self, client_id, port, on_message):
+        self.client_id = client_id
+        self.port = port
+        self.on_message = on_message  # called with device, topic, msg
+        self.reader = None
+        self.writer = None
+        self._mid = 0
+        self._tasks = []
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+        self.writer.write(binascii.hexlify(bytes([0x2C, 0, 0])) + self.client_id.encode() + b"\n")
+        self._tasks = [asyncio.ensure_future(self._read()), asyncio.ensure_future(self._keepalive())]
+
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self.writer.close()
+
+    async def _keepalive(self):
+        while True:
+            self.writer.write(b"\n")
+            await asyncio.sleep(0.5)
+
+    async def _read(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                return
+            line = line.strip()
+            if len(line) < 6:
+                continue
+            preheader = binascii.unhexlify(line[:6])
+            if preheader[2] == 0x2C:
+                continue  # ACK
+            if preheader[2] & 0x01:
+                self.writer.write(binascii.hexlify(bytes([preheader[0], 0, 0x2C])) + b"\n")
+            data = json.loads(line[6 + preheader[1] * 2:])
+            self.on_message(self, data[0], data[2])
+
+    def send(self, command, data):
+        preheader = bytes([self._mid, 3, 1])  # qos, server sends ACK
+        self._mid = (self._mid + 1) & 0xFF or 1
+        self.writer.write(binascii.hexlify(preheader) + binascii.hexlify(bytes([IDENT, 1, command])) +
+                          json.dumps(data).encode() + b"\n")
+
+
+def overrideRegistry(config):
+    """Serve only the mqtt app with the given config instead of reading apps.yaml"""
+    registry = {IDENT: (config, "apps.mqtt")}
+    AppHandler._buildRegistry = classmethod(lambda cls: (registry, {}, {}))
+    AppHandler._registryFiles = classmethod(lambda cls: {})
+
+
+async def waitFor(condition, timeout):
+    st = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - st > timeout:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+
+def printLatency(name, histogram, duration):
+    print("{!s:16} {:8} msgs {:9.0f} msg/s   latency ms p50 {:7.2f} p90 {:7.2f} p99 {:7.2f} max {:7.2f}".format(
+        name, histogram.count, histogram.count / duration if duration > 0 else 0,
+        histogram.percentile(50) * 1000, histogram.percentile(90) * 1000, histogram.percentile(99) * 1000,
+        histogram.max * 1000))
+
+
+async def recovery(broker, devices, timeout=60):
+    """Publish probes to all devices until every device received one, returns the seconds needed"""
+    st = time.perf_counter()
+    pending = set(d.client_id for d in devices)
+
+    def on_probe(device, topic, msg):
+        if topic.endswith("/probe"):
+            pending.discard(device.client_id)
+
+    for device in devices:
+        device.on_message = on_probe
+    while len(pending) > 0 and time.perf_counter() - st < timeout:
+        for client_id in list(pending):
+            broker.publish("bench/{!s}/probe".format(client_id), b"probe")
+        await asyncio.sleep(0.05)
+    return time.perf_counter() - st, len(pending)
+
+
+async def run(amount, messages, mode, engine):
+    loop = asyncio.get_event_loop()
+    broker = Broker()
+    await broker.start(BROKER_PORT)
+    overrideRegistry({"module": "mqtt", "class": "Mqtt", "ident": IDENT, "instanced_app": True,
+                      "host": "127.0.0.1", "port": BROKER_PORT, "user": "bench", "password": "bench",
+                      "keepalive": 60, "mqtt_home": "bench", "engine": engine, "bridge": mode == "bridge"})
+    network = Network(hostname="127.0.0.1", port=SERVER_PORT, client_class=clients.Client,
+                      timeout_connection=2000)
+    await network.init(loop)
+    threads = threading.active_count()
+    tracemalloc.start()
+    memory = tracemalloc.get_traced_memory()[0]
+    devices = [SimDevice("bench{!s}".format(i), SERVER_PORT, None) for i in range(amount)]
+    st = time.perf_counter()
+    for device in devices:
+        await device.connect()
+    for device in devices:
+        device.send(CMD_SUBS, [["bench/{!s}/+".format(device.client_id)], False])
+    if engine == "paho" and mode == "direct" and amount > 150:
+        print("paho engine without bridge is limited to ~150 devices in this benchmark, see header")
+    if not await waitFor(lambda: len(broker.subscriptions) >= amount, 60):
+        print("Only {!s}/{!s} devices subscribed".format(len(broker.subscriptions), amount))
+    print("{!s} devices ({!s}, {!s} engine) connected and subscribed in {:.2f}s".format(
+        amount, mode, engine, time.perf_counter() - st))
+    await asyncio.sleep(0.5)  # let connects settle before measuring
+    memory = tracemalloc.get_traced_memory()[0] - memory
+    tracemalloc.stop()
+    print("threads: {!s} ({:+d}), memory per device: {:.1f}kB, broker connections: {!s}".format(
+        threading.active_count(), threading.active_count() - threads, memory / amount / 1024,
+        len(broker.connections)))
+
+    # broker -> device
+    received = Histogram()
+
+    def on_message(device, topic, msg):
+        received.record(time.perf_counter() - float(msg))
+
+    for device in devices:
+        device.on_message = on_message
+    total = amount * messages
+    st = time.perf_counter()
+    for i in range(messages):
+        topic = "bench/{!s}/" + str(i % TOPICS)
+        for device in devices:
+            broker.publish(topic.format(device.client_id), str(time.perf_counter()).encode())
+        await asyncio.sleep(0)
+    await waitFor(lambda: received.count >= total, 30)
+    printLatency("broker->device", received, time.perf_counter() - st)
+    if received.count < total:
+        print("{!s:16} {!s} messages conflated or lost".format("", total - received.count))
+
+    # device -> broker
+    published = Histogram()
+
+    def on_publish(topic, payload):
+        if topic.endswith("/out"):
+            published.record(time.perf_counter() - float(payload))
+
+    broker.on_publish = on_publish
+    st = time.perf_counter()
+    for i in range(messages):
+        for device in devices:
+            device.send(CMD_PUB, ["bench/{!s}/out".format(device.client_id), str(time.perf_counter()), False])
+        await asyncio.sleep(0)
+    await waitFor(lambda: published.count >= total, 30)
+    printLatency("device->broker", published, time.perf_counter() - st)
+    broker.on_publish = None
+
+    # all devices reconnect at once
+    for device in devices:
+        device.close()
+    await asyncio.sleep(0.1)
+    st = time.perf_counter()
+    for device in devices:
+        await device.connect()
+        device.send(CMD_SUBS, [["bench/{!s}/+".format(device.client_id)], False])  # client resubscribe
+    duration, missing = await recovery(broker, devices)
+    print("device reconnect storm: recovered in {:.2f}s, {!s} devices missing".format(duration, missing))
+
+    # broker restart
+    connects = broker.connects
+    subscribes = broker.subscribes
+    broker.dropAll()
+    duration, missing = await recovery(broker, devices)
+    print("broker restart: recovered in {:.2f}s, {!s} devices missing, {!s} broker connects, {!s} SUBSCRIBE".format(
+        duration, missing, broker.connects - connects, broker.subscribes - subscribes))
+
+    for device in devices:
+        device.close()
+    await network.shutdown()
+    broker.stop()
+
+
+def main():
+    amount = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    mode = sys.argv[3] if len(sys.argv) > 3 else "direct"
+    engine = sys.argv[4] if len(sys.argv) > 4 else "asyncio"
+    logging.basicConfig(level=logging.ERROR)
+    asyncio.get_event_loop().run_until_complete(run(amount, messages, mode, engine))
+
+
+if __name__ == "__main__":
+    main()
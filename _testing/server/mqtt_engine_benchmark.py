@@ -0,0 +1,94 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2019 Released under the MIT license
+# Created on 2019-03-11
+
+__updated__ = "2019-03-11"
+__version__ = "0.0"
+
+# Compares the mqtt engines of the mqtt app: paho (one thread per client, callbacks handed to the
+# event loop with run_coroutine_threadsafe) and the asyncio client (callbacks in the event loop).
+# A subscriber receives messages published by a publisher of the same engine through a broker.
+# Reports received messages per second and per cpu second of this process (all threads).
+# Usage: python3 -m _testing.server.mqtt_engine_benchmark <broker host> [port] [messages] [payload size]
+
+import asyncio
+import sys
+import time
+
+from server.apps.mqtt import mqtt_async
+
+TOPIC = "benchmark/mqtt_engine"
+
+
+async def run(engine, host, port, messages, payload):
+    loop = asyncio.get_event_loop()
+    if engine == "paho":
+        from paho.mqtt.client import Client
+    else:
+        Client = mqtt_async.Client
+    received = 0
+    done = asyncio.Event()
+    connected = asyncio.Event()
+
+    async def count():
+        nonlocal received
+        received += 1
+        if received == messages:
+            done.set()
+
+    def on_message(client, userdata, msg):
+        # same handoff as MqttInstance._schedule
+        if engine == "paho":
+            asyncio.run_coroutine_threadsafe(count(), loop)
+        else:
+            asyncio.ensure_future(count())
+
+    def on_connect(client, userdata, flags, rc):
+        loop.call_soon_threadsafe(connected.set)
+
+    sub = Client(client_id="benchmark_sub_{!s}".format(engine))
+    sub.on_message = on_message
+    sub.on_connect = on_connect
+    pub = Client(client_id="benchmark_pub_{!s}".format(engine))
+    sub.connect(host, port, 60)
+    pub.connect(host, port, 60)
+    sub.loop_start()
+    pub.loop_start()
+    await connected.wait()
+    sub.subscribe(TOPIC, 0)
+    await asyncio.sleep(1)  # SUBACK
+    wall = time.time()
+    cpu = time.process_time()
+    for i in range(messages):
+        pub.publish(TOPIC, payload, 0)
+        if i % 100 == 0:
+            await asyncio.sleep(0)  # let the loop send and receive
+    try:
+        await asyncio.wait_for(done.wait(), 60)
+    except asyncio.TimeoutError:
+        print("{!s}: timeout, received {!s}/{!s} messages".format(engine, received, messages))
+    wall = time.time() - wall
+    cpu = time.process_time() - cpu
+    print("{!s:8} {!s:>8} messages, {:10.0f} msg/s, {:10.0f} msg/cpu-s".format(
+        engine, received, received / wall, received / cpu if cpu > 0 else 0))
+    sub.disconnect()
+    pub.disconnect()
+    sub.loop_stop()
+    pub.loop_stop()
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: mqtt_engine_benchmark.py <broker host> [port] [messages] [payload size]")
+        return
+    host = sys.argv[1]
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 1883
+    messages = int(sys.argv[3]) if len(sys.argv) > 3 else 20000
+    payload = "x" * (int(sys.argv[4]) if len(sys.argv) > 4 else 64)
+    loop = asyncio.get_event_loop()
+    for engine in ("paho", "asyncio"):
+        loop.run_until_complete(run(engine, host, port, messages, payload))
+
+
+if __name__ == "__main__":
+    main()
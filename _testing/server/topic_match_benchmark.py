@@ -0,0 +1,94 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2019 Released under the MIT license
+# Created on 2019-03-12
+
+__updated__ = "2019-03-12"
+__version__ = "0.0"
+
+# Matching topics against 10k subscriptions with SubscriptionHandler (TopicTrie) compared to
+# the previous implementation, which built a paho MQTTMatcher for every subscription on every check,
+# and to a single shared paho MQTTMatcher if paho is installed.
+# Usage: python3 -m _testing.server.topic_match_benchmark [subscriptions] [lookups]
+
+import random
+import sys
+import time
+
+from server.apps.mqtt.subscriptions import SubscriptionHandler
+
+try:
+    from paho.mqtt.matcher import MQTTMatcher
+except ImportError:
+    MQTTMatcher = None
+
+
+def subscriptions(amount):
+    subs = set()
+    while len(subs) < amount:
+        building = "building{!s}".format(random.randint(0, 99))
+        room = "room{!s}".format(random.randint(0, 49))
+        kind = random.random()
+        if kind < 0.7:
+            subs.add("{!s}/{!s}/sensor{!s}/set".format(building, room, random.randint(0, 9)))
+        elif kind < 0.85:
+            subs.add("{!s}/+/sensor{!s}/set".format(building, random.randint(0, 9)))
+        else:
+            subs.add("{!s}/{!s}/#".format(building, room))
+    return list(subs)
+
+
+def topics(amount):
+    return ["building{!s}/room{!s}/sensor{!s}/set".format(random.randint(0, 99), random.randint(0, 49),
+                                                          random.randint(0, 9)) for _ in range(amount)]
+
+
+def matchLinear(subs, topic):
+    # previous SubscriptionHandler.get: one new MQTTMatcher per subscription and check
+    ret = {}
+    for sub in subs:
+        matcher = MQTTMatcher()
+        matcher[sub] = True
+        try:
+            next(matcher.iter_match(topic))
+            ret[sub] = True
+        except StopIteration:
+            pass
+    return ret
+
+
+def bench(name, func, lookups):
+    st = time.perf_counter()
+    matches = 0
+    for topic in lookups:
+        matches += len(func(topic))
+    duration = time.perf_counter() - st
+    print("{!s:28} {:10.1f} us/lookup, {:8.0f} lookups/s, {!s} matches".format(
+        name, duration / len(lookups) * 1e6, len(lookups) / duration, matches))
+
+
+def main():
+    amount = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    random.seed(1)
+    subs = subscriptions(amount)
+    lookup_topics = topics(lookups)
+    st = time.perf_counter()
+    handler = SubscriptionHandler("Qos", "OnlyRetained")
+    for sub in subs:
+        handler.addObject(sub, {"Qos": 2, "OnlyRetained": False})
+    print("{!s} subscriptions, inserted into TopicTrie in {:.1f}ms".format(
+        amount, (time.perf_counter() - st) * 1000))
+    bench("SubscriptionHandler.match", handler.match, lookup_topics)
+    if MQTTMatcher is not None:
+        matcher = MQTTMatcher()
+        for sub in subs:
+            matcher[sub] = sub
+        bench("shared paho MQTTMatcher", lambda topic: list(matcher.iter_match(topic)), lookup_topics)
+        # previous implementation is too slow for all lookups
+        bench("previous (matcher per sub)", lambda topic: matchLinear(subs, topic), lookup_topics[:20])
+    else:
+        print("paho not installed, skipping comparison")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,7 @@ __updated__ = "2019-01-11"
 __version__ = "0.0"
 
 from .apphandler import AppHandler, TimeoutError, get_apphandler
+from .micropython_iot import Event
 import uasyncio as asyncio
 import time
 import gc
@@ -121,3 +122,83 @@ async def AppTemporary(AppClass, header, message, timeout=120, ident=None):
         del app
         gc.collect()
     return data
+
+
+class RpcError(Exception):
+    pass
+
+
+class AppRpc(App):
+    def __init__(self):
+        """
+        App for request/response communication like GET requests with a server app based on RpcApp.
+        Requests get a correlation id so multiple requests can be in flight at the same time
+        and every response resolves the request waiting for it.
+        Keep one instance for many requests instead of creating an AppTemporary for each request.
+        Change the app ident to the ident of the server app.
+        """
+        super().__init__()
+        self._requests = {}  # correlation id: Event
+        self._cid = 0
+        self.print_error = print  # change this function if you use a different way of logging
+
+    def handle(self, header: int, data: any):
+        """
+        Resolve the request waiting for this response
+        :param header: header int (one byte)
+        :param data: [correlation id, result] or [correlation id, None, error]
+        :return:
+        """
+        if type(data) != list or len(data) < 2 or type(data[0]) != int:
+            self.print_error("Malformed response: {!s}".format(data))
+            return
+        event = self._requests.get(data[0])
+        if event is not None:  # otherwise the request already timed out
+            event.set(data)
+
+    async def request(self, header: int, message: any, timeout=120):
+        """
+        Send a request and wait for the response.
+        :param header: int (0-255)
+        :param message: request
+        :param timeout: seconds, timeout waiting for a response after the request has been sent
+        :return: result
+        """
+        cid = self._cid
+        self._cid = (self._cid + 1) & 0xFFFF
+        event = Event()
+        self._requests[cid] = event
+        try:
+            if not await self.write(header, [cid, message]):
+                raise TimeoutError("App stopped")
+            s = time.ticks_ms()
+            while not event.is_set():
+                if time.ticks_diff(time.ticks_ms(), s) > timeout * 1000 or not self.active:
+                    raise TimeoutError("Timeout waiting for a response")  # or app has been stopped
+                await asyncio.sleep_ms(20)  # not sleep_ms(0), that would keep the CPU busy while waiting
+            data = event.value()
+        finally:
+            del self._requests[cid]
+        if len(data) > 2:
+            raise RpcError(data[2])
+        return data[1]
+
+
+_rpc_apps = {}  # ident: AppRpc shared by all AppRequest calls
+
+
+async def AppRequest(ident, header, message, timeout=120):
+    """
+    Send a request to the server app with the given ident using a shared AppRpc instance.
+    Unlike AppTemporary no app instance gets created for each request.
+    :param ident: app ident of the server app
+    :param header: header of message if used by app
+    :param message: what you want to send to the server
+    :param timeout: seconds, timeout waiting for an answer
+    :return: server response
+    """
+    if ident not in _rpc_apps:
+        app = AppRpc()
+        app.ident = ident
+        _rpc_apps[ident] = app
+    return await _rpc_apps[ident].request(header, message, timeout)
@@ -21,10 +21,13 @@ CMD_SUBS = const(2)
 CMD_UNSUBS = const(3)
 CMD_WILL = const(4)
 CMD_WELC = const(5)
+CMD_ALIAS = const(6)
+
+ALIASES = const(32)  # max topic aliases defined for messages sent to the server
 
 
 class Mqtt:
-    def __init__(self, will: list = None, welc: list = None):
+    def __init__(self, will: list = None, welc: list = None, aliases=False):
         ####
         # Proxy/Server has credentials for mqtt broker and will connect automatically
         ####
@@ -46,6 +49,13 @@ class Mqtt:
                 welc.pop(3)
             asyncio.get_event_loop().create_task(self._write(CMD_WELC, welc))
         self._welc = welc
+        # topics are replaced by integer aliases on the connection to the server after their first use
+        self._aliases = aliases
+        self._tx = {}  # topic: alias, definition received by server
+        self._tx_pending = {}  # topic: alias, definition sent but not yet received by server
+        self._rx = {}  # alias: topic, defined by server
+        if aliases:
+            asyncio.get_event_loop().create_task(self._write(CMD_ALIAS, None))
         self._old_state = True
         self.print_error = print  # change this function if you use a different way of logging
 
@@ -68,6 +78,12 @@ class Mqtt:
         topics = data[1]
         if type(topics) != list:
             topics = [topics]
+        try:
+            data[0] = self._resolve(data[0])
+            topics = [self._resolve(topic) for topic in topics]
+        except KeyError:
+            self.print_error("Unknown topic alias in {!s}".format(data))
+            return
         for topic in topics:
             try:
                 cbs = self._subs.get(topic)
@@ -87,9 +103,44 @@ class Mqtt:
             for cb in cbs:
                 loop.create_task(self._wrapper(cb, data))
 
+    def _resolve(self, ref):
+        # alias sent by server: int alias, {topic: alias} on first use or topic
+        if type(ref) == int:
+            return self._rx[ref]
+        if type(ref) == dict:
+            for topic in ref:
+                self._rx[ref[topic]] = topic
+                return topic
+        return ref
+
+    def _ref(self, topic):
+        # alias for a topic sent to the server, the definition is sent until the server received it
+        if self._aliases is False:
+            return topic
+        alias = self._tx.get(topic)
+        if alias is not None:
+            return alias
+        alias = self._tx_pending.get(topic)
+        if alias is None:
+            if len(self._tx) + len(self._tx_pending) >= ALIASES:
+                return topic
+            alias = len(self._tx) + len(self._tx_pending)
+            self._tx_pending[topic] = alias
+        return {topic: alias}
+
+    def _defined(self, ref):
+        if type(ref) == dict:
+            for topic in ref:
+                alias = self._tx_pending.pop(topic, None)
+                if alias is not None:
+                    self._tx[topic] = alias
+
     def concb(self, state):
         if state is True and self._old_state is False:
             # assume new connection needs subscribing to all topics again
+            # server might have lost the aliases
+            self._tx = {}
+            self._tx_pending = {}
             asyncio.get_event_loop().create_task(self._resubscribe())
         self._old_state = state
 
@@ -100,8 +151,12 @@ class Mqtt:
         welc = self._welc
         if welc is not None:
             await self._write(CMD_WELC, welc)
-        for subs in self._subs:
-            await self._write(CMD_SUBS, [subs, False])
+        if self._aliases:
+            await self._write(CMD_ALIAS, None)
+        refs = [self._ref(subs) for subs in self._subs]
+        if len(refs) > 0 and await self._write(CMD_SUBS, [refs, False]):  # all topics in one message
+            for ref in refs:
+                self._defined(ref)
 
     async def subscribe(self, topic, callback_coro, qos=2, check_retained_state_topic=True):
         """
@@ -113,7 +168,23 @@ class Mqtt:
         :return:
         """
         self._subs.add(topic, callback_coro)
-        await self._write(CMD_SUBS, [topic, check_retained_state_topic])
+        ref = self._ref(topic)
+        if await self._write(CMD_SUBS, [ref, check_retained_state_topic]):
+            self._defined(ref)
+
+    async def subscribeMany(self, subscriptions: list, check_retained_state_topic=True):
+        """
+        Subscribe to multiple topics with one message
+        :param subscriptions: list of (topic, callback_coro)
+        :param check_retained_state_topic: see subscribe()
+        :return:
+        """
+        for topic, callback_coro in subscriptions:
+            self._subs.add(topic, callback_coro)
+        refs = [self._ref(topic) for topic, callback_coro in subscriptions]
+        if await self._write(CMD_SUBS, [refs, check_retained_state_topic]):
+            for ref in refs:
+                self._defined(ref)
 
     async def publish(self, topic, msg, qos=2, retain=False):
         """
@@ -123,7 +194,9 @@ class Mqtt:
         :param qos: just for compatibility, server will use qos=2 as the server is powerful
         :return:
         """
-        await self._write(CMD_PUB, [topic, msg, retain])
+        ref = self._ref(topic)
+        if await self._write(CMD_PUB, [ref, msg, retain]):
+            self._defined(ref)
 
     def schedulePublish(self, topic, msg, qos=2, retain=False):
         asyncio.get_event_loop().create_task(self.publish(topic, msg, retain=retain))
@@ -0,0 +1,23 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2019 Released under the MIT license
+# Created on 2019-03-16
+
+__updated__ = "2019-03-16"
+__version__ = "0.0"
+
+from .mqtt import Mqtt
+from micropython import const
+
+# IDENT to identify app on server
+IDENT = const(2)
+
+
+class PubSub(Mqtt):
+    def __init__(self, will: list = None, welc: list = None):
+        """
+        Publish/subscribe between devices connected to the same server without an mqtt broker.
+        Same API as Mqtt, messages only reach devices using PubSub.
+        Topic aliases are not supported by the pubsub app.
+        """
+        super().__init__(will, welc, aliases=False)
+        self.ident = IDENT  # set before the will and welcome message get sent by the tasks created in Mqtt
@@ -39,6 +39,33 @@ def isnew(mid, lst=bytearray(32)):
     return res
 
 
+class _PendingWrite:
+    """
+    Write returned by writeEncodedNowait that already claimed its mid.
+    If it gets closed without being awaited, e.g. because the caller got cancelled before the write started,
+    the sending slot of the mid is released so later writes don't wait for it forever.
+    """
+    __slots__ = ("_client", "_mid", "_coro")
+
+    def __init__(self, client, mid, coro):
+        self._client = client
+        self._mid = mid
+        self._coro = coro
+
+    def __await__(self):
+        coro, self._coro = self._coro, None  # _writeEncoded releases the slot itself once started
+        return coro.__await__()
+
+    def close(self):
+        if self._coro is not None:
+            self._coro.close()
+            self._coro = None
+            self._client._releaseSlot(self._mid)
+
+    def __del__(self):
+        self.close()
+
+
 class Client(ClientGeneric):
     def __init__(self, client_id=None, len_rx_buffer=100, len_tx_buffer=100, timeout_connection=1500,
                  timeout_client_object=3600):
@@ -57,6 +84,7 @@ class Client(ClientGeneric):
         super().__init__(client_id, len_rx_buffer, len_tx_buffer, timeout_connection, timeout_client_object)
         self._getmid = gmid()
         self._ack_mid = -1  # last received ACK mid
+        self._ack_time = 0  # arrival of the last ACK, more exact than the polling in _writeEncoded
         self._tx_mid = 0  # sent mid, used for keeping messages in order
         self._recv_mid = bytearray(32)  # for deduping
         self._last_tx_time = 0
@@ -119,6 +147,14 @@ class Client(ClientGeneric):
                 return self._rx_messages.pop(0)
         raise asyncio.TimeoutError("Timeout waiting for a new message")
 
+    def _unread(self, message):
+        """
+        Put a message returned by read() back to the front of the receive buffer
+        :param message: (header, message) as returned by read()
+        """
+        self._rx_messages.insert(0, message)
+        self._rx_message_event.set()
+
     async def _reader(self):
         try:
             while True:
@@ -137,6 +173,7 @@ class Client(ClientGeneric):
                 if preheader[2] & 0x2C == 0x2C:  # ACK
                     # self.log.debug("Got ack mid {!s}".format(mid))
                     self._ack_mid = mid
+                    self._ack_time = time.time()
                     continue
                 if not mid:
                     isnew(-1, self._recv_mid)
@@ -222,6 +259,21 @@ class Client(ClientGeneric):
             self._reader_task.cancel()
         await super().stop()
 
+    @staticmethod
+    def encode(header: bytearray, message) -> bytes:
+        """
+        Encode header and message to the part of a frame that is equal for every client.
+        Only the preheader containing the mid has to be added per client.
+        :param header: bytearray or None
+        :param message: str/bytes or any object that can be converted by json.dumps
+        :return: bytes
+        """
+        if type(message) not in (bytes, str):
+            message = json.dumps(message)
+        if type(message) == str:
+            message = message.encode()
+        return (binascii.hexlify(header) if header is not None else b"") + message
+
     async def write(self, header: bytearray, message, timeout=math.inf, only_with_connection=False, qos=True):
         """
         If no timeout is specified, will wait forever until device is connected.
@@ -239,23 +291,79 @@ class Client(ClientGeneric):
             except Exception as e:
                 self.log.error("Could not convert message, {!s}".format(e))
                 raise e
-        if type(message) == str:
-            message = message.encode()
-        if timeout is None:
-            timeout = math.inf
-        preheader = bytearray(3)
-        preheader[0] = next(self._getmid)
-        preheader[1] = 0 if header is None else len(header)
-        preheader[2] = 0  # special internal usages, e.g. for esp_link
-        mid = preheader[0]
-        if qos:
-            preheader[2] |= 0x01  # qos==True, request ACK
-        preheader = binascii.hexlify(preheader)
         try:
-            message = preheader + (binascii.hexlify(header) if header is not None else b"") + message
+            message = self.encode(header, message)
         except Exception as e:
             self.log.error("Could not merge message, {!s}".format(e))
             return False
+        return await self.writeEncoded(0 if header is None else len(header), message, timeout,
+                                       only_with_connection, qos)
+
+    def writeEncodedNowait(self, header_len: int, message: bytes, timeout=math.inf, only_with_connection=False,
+                           qos=True):
+        """
+        Write an already encoded message (see encode()) if it can be sent immediately.
+        Only possible for qos==False messages while connected and no other message waiting for its sending slot.
+        Otherwise an awaitable is returned that has to be awaited to send the message.
+        :param header_len: length of the header contained in message
+        :param message: bytes, encoded header+message
+        :param timeout: float, only used if a coroutine is returned
+        :param only_with_connection: bool, only used if a coroutine is returned
+        :param qos: bool
+        :return: True on success, False on error, awaitable if message could not be sent immediately
+        """
+        mid = next(self._getmid)
+        if qos or self._tx_mid != mid or not self.connected.is_set() or self._removed:
+            return _PendingWrite(self, mid, self._writeEncoded(mid, header_len, message, timeout,
+                                                               only_with_connection, qos))
+        try:
+            return self._send(self._preheader(mid, header_len, qos) + message)
+        finally:
+            self._nextSlot()
+
+    async def writeEncoded(self, header_len: int, message: bytes, timeout=math.inf, only_with_connection=False,
+                           qos=True):
+        """
+        Write an already encoded message (see encode()), only the preheader will be added.
+        :param header_len: length of the header contained in message
+        :param message: bytes, encoded header+message
+        :param timeout: float
+        :param only_with_connection: bool
+        :param qos: bool
+        :return: True on success, False on error, TimeoutError on timeout
+        """
+        return await self._writeEncoded(next(self._getmid), header_len, message, timeout, only_with_connection, qos)
+
+    @staticmethod
+    def _preheader(mid, header_len, qos) -> bytes:
+        preheader = bytearray(3)
+        preheader[0] = mid
+        preheader[1] = header_len
+        preheader[2] = 0  # special internal usages, e.g. for esp_link
+        if qos:
+            preheader[2] |= 0x01  # qos==True, request ACK
+        return binascii.hexlify(preheader)
+
+    def _releaseSlot(self, mid):
+        """Give up the sending slot of a mid that will never be written"""
+        if self._tx_mid == mid:
+            self._nextSlot()
+        else:
+            self._tx_mid_offset += 1
+
+    def _nextSlot(self):
+        self._tx_mid += 1
+        self._tx_mid += self._tx_mid_offset
+        self._tx_mid_offset = 0
+        if self._tx_mid >= 256:
+            self._tx_mid = self._tx_mid - 255  # reset to 1+offset
+
+    async def _writeEncoded(self, mid, header_len, message, timeout, only_with_connection, qos):
+        if timeout is None:
+            timeout = math.inf
+        preheader = self._preheader(mid, header_len, qos)
+        encoded = message
+        message = preheader + message
         # disconnect on timeout waiting for sending slot is wrong. Only disconnect on ACK timeout.
         st = time.time()
         try:
@@ -276,7 +384,7 @@ class Client(ClientGeneric):
                     if self._removed:
                         raise ClientRemovedException
                     if self.connected.is_set():
-                        self.log.debug("Writing message {!s}, {!s}, {!s}".format(preheader, header, message))
+                        self.log.debug("Writing message {!s}".format(message))
                         ret = await self._write_qos(message)
                         if ret is False:
                             continue
@@ -300,6 +408,7 @@ class Client(ClientGeneric):
                         if self.closing.is_set():  # if client is shutting down, don't resend
                             return False
                     else:
+                        self._acknowledged(header_len, encoded, self._ack_time - st_ack)
                         return True
                 self.log.debug("Timeout sending message {!s}".format(message))
                 raise asyncio.TimeoutError
@@ -310,22 +419,30 @@ class Client(ClientGeneric):
             self.log.info("Write mid {!s} got externally canceled".format(mid))
             raise
         finally:
-            self._tx_mid += 1
-            self._tx_mid += self._tx_mid_offset
-            self._tx_mid_offset = 0
-            if self._tx_mid >= 256:
-                self._tx_mid = self._tx_mid - 255  # reset to 1+offset
+            self._nextSlot()
+
+    def _acknowledged(self, header_len, message, latency):
+        """
+        Called when a qos message got acknowledged, override to collect statistics
+        :param header_len: length of the header contained in message
+        :param message: bytes, encoded header+message without preheader
+        :param latency: float, seconds from sending the message until its ACK arrived
+        """
+        pass
 
     async def _write_qos(self, message):
         """
         :param message: str/bytes
         :return: True on success, False on error, Exception if only_with_connection==False and timeout
         """
-        if not message.endswith("\n" if type(message) == str else b"\n"):
-            message += "\n" if type(message) == str else b"\n"
         self.log.debug("Writing message {!s}".format(message))
         if type(message) == str:
             message = message.encode()
+        return self._send(message)
+
+    def _send(self, message: bytes) -> bool:
+        if not message.endswith(b"\n"):
+            message += b"\n"
         try:
             self.transport.transport.write(message)
         except Exception as e:
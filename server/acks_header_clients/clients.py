@@ -25,7 +25,7 @@ def getClient(client_id, *args, **kwargs) -> Client:
         return _getNetwork().clients[client_id]
     client = Client(client_id, *args, **kwargs)
     # basically a future client object without a transport/socket
-    _getNetwork().clients[client_id] = client
+    _getNetwork().addClient(client)
     return client
 
 
@@ -63,6 +63,49 @@ class MultipleClientHelper(generic_clients.MultipleClientHelper):
         res = await asyncio.gather(*tasks)
         return res
 
+    async def broadcast(self, header, message, timeout=math.inf, only_with_connection=False, qos=True):
+        """
+        Write to all clients of this object the same message.
+        Header and message are encoded only once, every client only adds its own preheader with the mid.
+        Messages that can be sent immediately (qos==False, sending slot free) are written to all connected
+        transports in one pass, all others are awaited concurrently.
+        Clients that don't exist yet will not receive the message.
+        :param header: bytearray
+        :param message: str or object that can be converted by json.dumps
+        :param timeout: float
+        :param only_with_connection: bool
+        :param qos: bool
+        :return: list, [ [<client_id>, bool], ...], True/False: message success
+        """
+        try:
+            message = Client.encode(header, message)
+        except Exception as e:
+            log.error("Could not encode message, {!s}".format(e))
+            raise e
+        header_len = 0 if header is None else len(header)
+
+        async def wrapper(res, coro):
+            try:
+                res[1] = await coro
+            except Exception:  # TimeoutError, ClientRemovedException
+                res[1] = False
+
+        clients = _getNetwork().clients
+        results = []
+        tasks = []
+        for client_id in self.client_ids:
+            client = clients.get(client_id)
+            if client is None or (only_with_connection and not client.connected.is_set()):
+                results.append([client_id, False])
+                continue
+            r = client.writeEncodedNowait(header_len, message, timeout, only_with_connection, qos)
+            results.append([client_id, r])
+            if type(r) != bool:  # has to be awaited
+                tasks.append(wrapper(results[-1], r))
+        if len(tasks) > 0:
+            await asyncio.gather(*tasks)
+        return results
+
     async def writeClient(self, client_id, header, message, timeout=math.inf, only_with_connection=False, qos=True):
         """
         Write to the client at client_id.
@@ -7,11 +7,15 @@ __version__ = "0.0"
 
 import logging
 import asyncio
+import concurrent.futures
 import yaml
 import importlib
 import math
+import time
 from pathlib import Path
 import os
+from server.context_logger import ContextLogger
+from server.apphandler.stats import AppStats
 
 log = logging.getLogger("AppHandler")
 
@@ -29,11 +33,42 @@ log = logging.getLogger("AppHandler")
 
 
 class AppInstance:
+    # Messages are put into a queue by the client reader and handled by worker coroutines of the instance,
+    # so a slow instance does not delay other apps of the same client.
+    # Both can be changed in the subclass or in the app config.
+    queue_size = 100  # max messages waiting to be handled, the client reader waits if the queue is full
+    concurrency = 1  # concurrently running handle() calls. With 1 messages are handled in order.
+    # "thread" runs handleBlocking(), "process" runs handleProcess() in an executor instead of handle() on the loop
+    executor = None
+    # if handleBatch() is implemented, it gets all buffered messages, up to batch_size messages.
+    # With batch_time>0 it waits up to batch_time seconds for more messages to fill the batch.
+    batch_size = 100
+    batch_time = 0
+
+    # Stopped instances are kept by the app and reused for new instances. Useful for short-lived instances.
+    # Extend reset() if the subclass holds state.
+    poolable = False
+
     def __init__(self, app, id, client):
-        self.log = logging.getLogger("{!s}.{!s}.{!s}".format(app.__class__.__name__, client.client_id, id))
+        self.log = ContextLogger(app.log, "{!s}.{!s}".format(client.client_id, id))
         self.app_id = id
         self.client = client
         self.app = app
+        self.queue_size = app.config.get("queue_size", self.queue_size)
+        self.concurrency = app.config.get("concurrency", self.concurrency)
+        self.executor = app.config.get("executor", self.executor)
+        self.batch_size = app.config.get("batch_size", self.batch_size)
+        self.batch_time = app.config.get("batch_time", self.batch_time)
+        if self.executor is not None and type(self).handleBatch is not AppInstance.handleBatch:
+            self.log.warning("Executor {!s} not supported with handleBatch(), handling on the loop".format(
+                self.executor))
+            self.executor = None
+        self._loop = asyncio.get_event_loop()
+        self._queue = asyncio.Queue(self.queue_size)
+        self._workers = []
+        self._busy = set()  # workers currently handling messages
+        self._replaced = False  # set during reload of the app, no new workers get started
+        self._stats = AppHandler.getAppStats(app.ident)
         self.log.info("Instance created")
 
     def __del__(self):
@@ -49,20 +84,56 @@ class AppInstance:
         """
         if self.app is not None:
             self.log.info("Stopping instance")
-            try:
-                del self.app.instances[(self.client, self.app_id)]
-            except KeyError:
+            current = asyncio.current_task()
+            for worker in self._workers:
+                if worker is not current:  # worker stops by itself if stop() is called within handle()
+                    worker.cancel()
+            self._workers = []
+            pending = []
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            if not self.app.removeInstance(self):
                 self.log.warning("Instance not found")
-            if self.app_id in self.client.apps:
+            if self.client.apps.get(self.app_id) is self:
                 del self.client.apps[self.app_id]
+            if len(pending) > 0 and not self.client.closing.is_set():
+                # messages received after the instance decided to stop, e.g. one-shot instances
+                self.client.redispatch(self.app.ident, self.app_id, pending)
+            app = self.app
             self.client = None
             self.app = None
+            if self.poolable:
+                app.releaseInstance(self)
         else:
             try:
                 self.log.error("Stopping although already stopped")
             except Exception:
                 pass
 
+    def reset(self, app, id, client):
+        """
+        Reinitialize a stopped instance taken from the pool of the app for a new client.
+        Extend in subclass if it is poolable and holds state.
+        """
+        self.log.context = "{!s}.{!s}".format(client.client_id, id)
+        self.app_id = id
+        self.client = client
+        self.app = app
+        self._replaced = False
+        self._stats = AppHandler.getAppStats(app.ident)
+        self.log.debug("Instance reused")
+
+    def migrate(self, old):
+        """
+        Extend in subclass.
+        Called instead of start() when the app gets reloaded and this instance replaces the instance
+        of the previous app version for the same client. Take over the state and resources of the old
+        instance here and detach them from it, as the old instance gets stopped afterwards and
+        stop() should then not have any side effects like disconnecting from a service.
+        :param old: AppInstance of the previous app version
+        """
+        self.log.debug("Migrating instance")
+
     def start(self):
         """
         Extend in subclass.
@@ -77,9 +148,123 @@ class AppInstance:
         """
         self.log.debug("Pausing instance")
 
+    async def dispatch(self, header_byte, data):
+        """
+        Queue a message for handle(), called by the client reader.
+        Waits if the queue is full.
+        :param header_byte: header_byte for the app
+        :param data: message
+        """
+        if len(self._workers) == 0 and not self._replaced:
+            self._startWorkers()
+        self._stats.messages.add()
+        await self._queue.put((time.time(), header_byte, data))
+
+    def dispatchNowait(self, item):
+        """
+        Queue an item that was already queued in a different instance
+        :param item: (timestamp, header_byte, data)
+        """
+        if len(self._workers) == 0 and not self._replaced:
+            self._startWorkers()
+        self._queue.put_nowait(item)
+
+    def _startWorkers(self):
+        for i in range(self.concurrency):
+            self._workers.append(asyncio.ensure_future(self._worker()))
+
+    async def _stopWorkers(self, timeout):
+        """
+        Stop the workers after the messages they are currently handling, queued messages stay in the queue.
+        Used when the instance gets replaced by an instance of a reloaded app.
+        :param timeout: float, workers still busy afterwards get canceled
+        """
+        self._replaced = True
+        workers, self._workers = self._workers, []
+        busy = []
+        for worker in workers:
+            if worker in self._busy:
+                busy.append(worker)  # exits after the current message as it is not in _workers anymore
+            else:
+                worker.cancel()
+        if len(busy) > 0:
+            done, pending = await asyncio.wait(busy, timeout=timeout)
+            for worker in pending:
+                worker.cancel()
+
+    async def _worker(self):
+        if type(self).handleBatch is not AppInstance.handleBatch:
+            return await self._workerBatch()
+        task = asyncio.current_task()
+        try:
+            while task in self._workers:  # removed on stop() so reused instances don't keep old workers
+                timestamp, header_byte, data = await self._queue.get()
+                st = time.time()
+                self._stats.queue_wait.record(st - timestamp)
+                self._busy.add(task)
+                try:
+                    if self.executor is None:
+                        await self.handle(header_byte, data)
+                    else:
+                        await self._handleInExecutor(header_byte, data)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.log.error("Error handling message {!s}: {!s}".format(data, e))
+                finally:
+                    self._busy.discard(task)
+                self._stats.handle.record(time.time() - st)
+        except asyncio.CancelledError:
+            pass
+
+    async def _workerBatch(self):
+        task = asyncio.current_task()
+        try:
+            while task in self._workers:
+                batch = [await self._queue.get()]
+                self._busy.add(task)
+                deadline = self._loop.time() + self.batch_time
+                while len(batch) < self.batch_size:
+                    if not self._queue.empty():
+                        batch.append(self._queue.get_nowait())
+                        continue
+                    remaining = deadline - self._loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+                st = time.time()
+                for timestamp, header_byte, data in batch:
+                    self._stats.queue_wait.record(st - timestamp)
+                try:
+                    await self.handleBatch([(header_byte, data) for timestamp, header_byte, data in batch])
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.log.error("Error handling batch of {!s} messages: {!s}".format(len(batch), e))
+                finally:
+                    self._busy.discard(task)
+                self._stats.handle.record(time.time() - st)
+        except asyncio.CancelledError:
+            pass
+
+    async def handleBatch(self, messages):
+        """
+        Optional, handle multiple messages from client at once, e.g. for bulk inserts.
+        If implemented in the subclass, it is called instead of handle() with all messages
+        buffered for this instance (see batch_size and batch_time). Always runs on the loop,
+        a configured executor is ignored with a warning.
+        :param messages: list of (header_byte, data)
+        """
+        for header_byte, data in messages:
+            await self.handle(header_byte, data)
+
     async def handle(self, header_byte, data):
         """
-        Handle message from client, do it quickly or start new task.
+        Handle message from client. Runs in a worker of this instance, so it can take some time
+        without blocking other apps but it delays the following messages of this instance.
         Subclass this.
         :param header_byte: header_byte for the app, if used by the app
         :param data: message
@@ -87,7 +272,51 @@ class AppInstance:
         """
         self.log.debug("got header {!s} data {!s}".format(header_byte, data))
 
-    async def write(self, header, message, timeout=math.inf, only_with_connection=False):
+    async def _handleInExecutor(self, header_byte, data):
+        if self.executor == "process":
+            # instance can't be transferred to another process, only the message
+            result = await self._loop.run_in_executor(AppHandler.getExecutor("process"), type(self).handleProcess,
+                                                      header_byte, data)
+        elif self.executor == "thread":
+            result = await self._loop.run_in_executor(AppHandler.getExecutor("thread"), self.handleBlocking,
+                                                      header_byte, data)
+        else:
+            raise TypeError("Unknown executor {!s}".format(self.executor))
+        if result is not None and self.app is not None:
+            await self.write(header_byte, result)
+
+    def handleBlocking(self, header_byte, data):
+        """
+        Handle message from client in a thread of the executor, used if executor is "thread".
+        Don't access the event loop directly, use writeThreadsafe() to send messages.
+        Subclass this.
+        :param header_byte: header_byte for the app, if used by the app
+        :param data: message
+        :return: None or message that will be sent to the client using the same header_byte
+        """
+        raise NotImplementedError("handleBlocking() not implemented")
+
+    @staticmethod
+    def handleProcess(header_byte, data):
+        """
+        Handle message from client in a different process, used if executor is "process".
+        Has no access to the instance, only the message and the result are transferred between processes.
+        Subclass this with a staticmethod.
+        :param header_byte: header_byte for the app, if used by the app
+        :param data: message
+        :return: None or message that will be sent to the client using the same header_byte
+        """
+        raise NotImplementedError("handleProcess() not implemented")
+
+    def writeThreadsafe(self, header, message, timeout=math.inf, only_with_connection=False, qos=False):
+        """
+        Send a message to the client of this instance from a different thread, e.g. within handleBlocking().
+        :return: concurrent.futures.Future with the result of write()
+        """
+        return asyncio.run_coroutine_threadsafe(self.write(header, message, timeout, only_with_connection, qos),
+                                                self._loop)
+
+    async def write(self, header, message, timeout=math.inf, only_with_connection=False, qos=False):
         """
         Send a message to the client of this instance.
         If no timeout is specified, will wait forever until device is connected (first connect).
@@ -96,32 +325,86 @@ class AppInstance:
         :param message: message as object (dict, list) or string
         :param timeout: float
         :param only_with_connection: bool
+        :param qos: bool, wait for the ACK of the client
         :return: bool
         """
         if type(header) != int or header > 255:
             self.log.error("Wrong header type: {!s}".format(header))
             return False
-        return await self.client.write(self.app.ident, self.app_id, header, message, timeout, only_with_connection)
+        st = time.time()
+        try:
+            ret = await self.client.write(self.app.ident, self.app_id, header, message, timeout, only_with_connection,
+                                          qos)
+        except asyncio.TimeoutError:
+            self._stats.write_failures += 1
+            raise
+        if ret:
+            self._stats.write.record(time.time() - st)
+        else:
+            self._stats.write_failures += 1
+        return ret
 
 
 class App:
     """App base class"""
-    instances = {}  # [(client,app_id)]=AppInstance
 
     def __init__(self, config):
+        self.instances = {}  # [(client,app_id)]=AppInstance, only instances of this app
+        self._client_instances = {}  # [client][app_id]=AppInstance
         self.ident = config["ident"]
         self.instanced = config["instanced_app"]
         self.config = config
         self.log = logging.getLogger(self.__class__.__name__)
         self.log.debug("Created app {!s}".format(self.__class__.__name__))
         self.AppInstance = AppInstance  # overwrite with your AppInstance class subclassed from the given one
+        self.instance_pool_size = config.get("instance_pool", 10)  # only used if AppInstance is poolable
+        self._pool = []
         self._stopwaiter = asyncio.ensure_future(self._waitStop())
 
     def getInstance(self, id, client) -> AppInstance:
         # self.log.debug("New instance {!s}".format(id))
-        self.instances[(client, id)] = self.AppInstance(self, id, client)
-        self.instances[(client, id)].start()
-        return self.instances[(client, id)]
+        if len(self._pool) > 0:
+            instance = self._pool.pop()
+            instance.reset(self, id, client)
+        else:
+            instance = self.AppInstance(self, id, client)
+        self.addInstance(instance)
+        instance.start()
+        return instance
+
+    def addInstance(self, instance: AppInstance):
+        self.instances[(instance.client, instance.app_id)] = instance
+        self._client_instances.setdefault(instance.client, {})[instance.app_id] = instance
+
+    def removeInstance(self, instance: AppInstance) -> bool:
+        """
+        :param instance: AppInstance
+        :return: True if instance was found and removed
+        """
+        key = (instance.client, instance.app_id)
+        if self.instances.get(key) is not instance:
+            return False
+        del self.instances[key]
+        client_instances = self._client_instances[instance.client]
+        del client_instances[instance.app_id]
+        if len(client_instances) == 0:
+            del self._client_instances[instance.client]
+        return True
+
+    def getInstancesOfClient(self, client) -> list:
+        """
+        :param client: Client
+        :return: list of all instances of this app for the client
+        """
+        return list(self._client_instances.get(client, {}).values())
+
+    def releaseInstance(self, instance: AppInstance):
+        """
+        Keep a stopped poolable instance for reuse
+        :param instance: AppInstance
+        """
+        if len(self._pool) < self.instance_pool_size and type(instance) is self.AppInstance:
+            self._pool.append(instance)
 
     def start(self):
         """extend in subclass"""
@@ -129,19 +412,20 @@ class App:
 
     async def stop(self):
         self.log.info("Stopping App")
-        if self._stopwaiter is not None:
-            self._stopwaiter.cancel()
+        if self._stopwaiter is not None and self._stopwaiter is not asyncio.current_task():
+            self._stopwaiter.cancel()  # not if stop() was called by _waitStop, it would cancel itself
         tasks = []
-        for app_instance in self.instances:
-            tasks.append(asyncio.ensure_future(self.instances[app_instance].stop()))
+        for app_instance in list(self.instances.values()):
+            tasks.append(asyncio.ensure_future(app_instance.stop()))
         try:
             await asyncio.wait_for(asyncio.gather(*tasks), 2)
         except asyncio.TimeoutError:
             self.log.warning("Stopping app took longer than 2s, cancelling")
         self.log.debug("Stop complete")
-        if self.ident in AppHandler.global_apps:
+        # app could already be replaced by a reloaded version
+        if AppHandler.global_apps.get(self.ident) is self:
             del AppHandler.global_apps[self.ident]
-        if self.ident in AppHandler.instanced_apps:
+        if AppHandler.instanced_apps.get(self.ident) is self:
             del AppHandler.instanced_apps[self.ident]
 
     async def _waitStop(self):
@@ -157,6 +441,12 @@ class AppHandler:
     global_apps = {}
     instanced_apps = {}
     stop_event = asyncio.Event()  # set by server_generic.Network.shutdown()
+    executor_workers = None  # max workers of the executors, None uses the default of concurrent.futures
+    _executors = {}
+    registry = None  # ident: (config, path_module), built once by loadRegistry()
+    _registry_inactive = {}  # ident: module name of apps not activated in apps.yaml
+    _registry_mtimes = {}  # path: mtime of all yaml files the registry was built from
+    stats = {}  # ident: AppStats, kept when an app gets stopped or reloaded
 
     @classmethod
     def getGlobalApp(cls, ident) -> App:
@@ -172,41 +462,135 @@ class AppHandler:
         return app
 
     @classmethod
-    def _loadApp(cls, ident):
-        log.debug("_loadApp {!s}".format(ident))
-        config = None
-        path_module = None
-        # TODO: check if apps.yaml exists
-        pathlist = Path(os.path.realpath(__file__)).parent.parent.glob("*.yaml")
-        apps_yaml = None
-        for path in pathlist:
-            if path.name == "apps.yaml":
-                apps_yaml = path
-                break
-        if apps_yaml is None:
+    def getExecutor(cls, kind) -> concurrent.futures.Executor:
+        """
+        Get the executor shared by all apps, created on first use
+        :param kind: "thread" or "process"
+        :return: Executor
+        """
+        if kind not in cls._executors:
+            if kind == "thread":
+                cls._executors[kind] = concurrent.futures.ThreadPoolExecutor(cls.executor_workers)
+            elif kind == "process":
+                cls._executors[kind] = concurrent.futures.ProcessPoolExecutor(cls.executor_workers)
+            else:
+                raise TypeError("Unknown executor {!s}".format(kind))
+        return cls._executors[kind]
+
+    @classmethod
+    def shutdownExecutors(cls):
+        for kind in cls._executors:
+            cls._executors[kind].shutdown(wait=False)
+        cls._executors = {}
+
+    @staticmethod
+    def _serverDir() -> Path:
+        return Path(os.path.realpath(__file__)).parent.parent
+
+    @classmethod
+    def _registryFiles(cls) -> dict:
+        """
+        :return: dict, path: mtime of apps.yaml and all app configs
+        """
+        server_dir = cls._serverDir()
+        apps_yaml = server_dir.joinpath("apps.yaml")
+        if not apps_yaml.exists():
             log.critical("Could not find apps.yaml in server directory")
             raise FileNotFoundError("Could not find apps.yaml")
-        with open(str(apps_yaml)) as f:
-            apps_available = yaml.load(f)
-        pathlist = Path(os.path.realpath(__file__)).parent.parent.joinpath("apps").glob("**/*.yaml")
-        for path in pathlist:
+        files = {str(apps_yaml): apps_yaml.stat().st_mtime}
+        for path in server_dir.joinpath("apps").glob("**/*.yaml"):
+            files[str(path)] = path.stat().st_mtime
+        return files
+
+    @classmethod
+    def _buildRegistry(cls) -> (dict, dict, dict):
+        """
+        Parse apps.yaml and all app configs.
+        Blocking file I/O, call only on startup or in an executor.
+        :return: registry, inactive apps, mtimes
+        """
+        server_dir = cls._serverDir()
+        mtimes = cls._registryFiles()
+        with open(str(server_dir.joinpath("apps.yaml"))) as f:
+            apps_available = yaml.safe_load(f) or {}
+        registry = {}
+        inactive = {}
+        for path in server_dir.joinpath("apps").glob("**/*.yaml"):
             with open(str(path)) as f:
-                y = yaml.load(f)
-                if y["ident"] == ident:
-                    if path.name.rstrip(".yaml") not in apps_available:
-                        log.error("Module {!s} not activated in apps.yaml".format(path.name.rstrip(".yaml")))
-                        raise ImportError
-                    else:
-                        config = y
-                        config.update(apps_available["mqtt"])
-                        path_module = str(
-                            path.parent.relative_to(path.parent.parent.parent)).replace("/",
-                                                                                        ".").replace(
-                            "\\", ".")
-                        break
-        if config is None:
-            log.error("App not available: {!s}".format(ident))
+                y = yaml.safe_load(f)
+            if y is None or "ident" not in y:
+                log.error("App config {!s} has no ident".format(path))
+                continue
+            if path.stem not in apps_available:
+                inactive[y["ident"]] = path.stem
+                continue
+            config = y
+            config.update(apps_available[path.stem] or {})
+            path_module = str(path.parent.relative_to(server_dir)).replace("/", ".").replace("\\", ".")
+            registry[y["ident"]] = (config, path_module)
+        return registry, inactive, mtimes
+
+    @classmethod
+    def loadRegistry(cls):
+        """
+        Build the app registry. Called once on server start so that loading an app
+        does not need any file I/O on the event loop.
+        """
+        cls.registry, cls._registry_inactive, cls._registry_mtimes = cls._buildRegistry()
+        log.info("App registry loaded, available apps: {!s}".format(
+            ", ".join("{!s}:{!s}".format(ident, cls.registry[ident][0]["module"]) for ident in cls.registry)))
+
+    @classmethod
+    async def watchRegistry(cls, interval=5):
+        """
+        Check the mtimes of the app configs every interval seconds and rebuild the registry if one changed.
+        Files are read in an executor to not block the loop.
+        Changes only affect apps loaded afterwards.
+        :param interval: float
+        """
+        loop = asyncio.get_event_loop()
+        while not cls.stop_event.is_set():
+            try:
+                await asyncio.wait_for(cls.stop_event.wait(), interval)
+            except asyncio.TimeoutError:  # reacts to stop_event in time without canceling externally
+                pass
+            else:
+                return
+            try:
+                mtimes = await loop.run_in_executor(None, cls._registryFiles)
+                if mtimes == cls._registry_mtimes:
+                    continue
+                registry, inactive, mtimes = await loop.run_in_executor(None, cls._buildRegistry)
+            except Exception as e:
+                log.error("Error reloading app registry: {!s}".format(e))
+                continue
+            cls.registry, cls._registry_inactive, cls._registry_mtimes = registry, inactive, mtimes
+            log.info("App registry reloaded")
+
+    @classmethod
+    def _loadApp(cls, ident):
+        log.debug("_loadApp {!s}".format(ident))
+        config, module = cls._importApp(ident)
+        return cls._createApp(ident, config, module)
+
+    @classmethod
+    def _importApp(cls, ident):
+        """
+        Import the module of an app. Does not access the event loop so it can be run in an executor.
+        :param ident: app ident
+        :return: config, module
+        """
+        if cls.registry is None:
+            log.warning("App registry not loaded on startup, loading now")
+            cls.loadRegistry()
+        if ident not in cls.registry:
+            if ident in cls._registry_inactive:
+                log.error("Module {!s} not activated in apps.yaml".format(cls._registry_inactive[ident]))
+            else:
+                log.error("App not available: {!s}".format(ident))
             raise ImportError
+        config, path_module = cls.registry[ident]
+        config = dict(config)  # apps should not change the registry
         try:
             log.debug("Trying import: {!s}.{!s}".format(path_module, config["module"]))
             module = importlib.import_module(path_module + "." + config["module"])
@@ -225,6 +609,10 @@ class AppHandler:
         except Exception as e:
             log.critical("Other exception importing module: {!s}".format(e))
             raise e
+        return config, module
+
+    @classmethod
+    def _createApp(cls, ident, config, module) -> App:
         try:
             cls_module = getattr(module, config["class"])
         except AttributeError as e:
@@ -239,6 +627,133 @@ class AppHandler:
             cls.global_apps[ident].start()
             return cls.global_apps[ident]
 
+    @classmethod
+    async def reloadApp(cls, ident) -> App:
+        """
+        Reload the module of an app and replace the running app without disconnecting clients.
+        Every instance of the old app finishes the messages it is currently handling and gets replaced
+        by a new instance for the same client and app_id, which can take over the state of the old one
+        in AppInstance.migrate(). Queued messages are moved to the new instance, then the old app gets stopped.
+        The app config is read from the current registry, so config changes are applied too.
+        :param ident: app ident
+        :return: new App
+        """
+        st = time.time()
+        old = cls.global_apps.get(ident, cls.instanced_apps.get(ident))
+        loop = asyncio.get_event_loop()
+        config, module = await loop.run_in_executor(None, cls._importApp, ident)
+        module = await loop.run_in_executor(None, importlib.reload, module)
+        new = cls._createApp(ident, config, module)
+        if old is None:
+            log.info("App {!s} was not loaded, loaded new version".format(ident))
+            return new
+        instances = list(old.instances.values())
+        # messages currently handled by the old instances are finished before their state gets migrated
+        await asyncio.gather(*[instance._stopWorkers(2) for instance in instances])
+        migrated = 0
+        for instance in instances:
+            if instance.app is not old:
+                continue  # stopped itself while finishing its messages
+            client = instance.client
+            if client is None or client.closing.is_set():
+                continue
+            new_instance = new.AppInstance(new, instance.app_id, client)
+            try:
+                new_instance.migrate(instance)
+                migrated += 1
+            except Exception as e:
+                log.error("Error migrating instance {!s} of app {!s}: {!s}".format(instance.app_id, ident, e))
+                new_instance.start()
+            new.addInstance(new_instance)
+            client.apps[instance.app_id] = new_instance
+            while not instance._queue.empty():
+                new_instance.dispatchNowait(instance._queue.get_nowait())
+        await old.stop()
+        log.info("Reloaded app {!s} ({!s}), migrated {!s} instances in {:.1f}ms".format(
+            ident, config["module"], migrated, (time.time() - st) * 1000))
+        return new
+
+    @classmethod
+    async def warmup(cls) -> dict:
+        """
+        Import and start all apps activated in apps.yaml that are not loaded yet.
+        Imports run concurrently in an executor, apps are created and started on the loop afterwards.
+        Apps failing to import are logged and will be retried when the first message for them arrives.
+        :return: dict, ident: {"import": seconds, "start": seconds}
+        """
+        if cls.registry is None:
+            cls.loadRegistry()
+        loop = asyncio.get_event_loop()
+
+        async def importApp(ident):
+            st = time.time()
+            config, module = await loop.run_in_executor(None, cls._importApp, ident)
+            return ident, config, module, time.time() - st
+
+        idents = [ident for ident in cls.registry if ident not in cls.global_apps and ident not in cls.instanced_apps]
+        timings = {}
+        for ident, res in zip(idents, await asyncio.gather(*[importApp(i) for i in idents], return_exceptions=True)):
+            if isinstance(res, Exception):
+                log.error("Warmup of app {!s} failed: {!s}".format(ident, res))
+                continue
+            ident, config, module, time_import = res
+            st = time.time()
+            try:
+                cls._createApp(ident, config, module)
+            except Exception as e:
+                log.error("Warmup of app {!s} failed: {!s}".format(ident, e))
+                continue
+            timings[ident] = {"import": time_import, "start": time.time() - st}
+            log.info("Warmed up app {!s} ({!s}), import {:.1f}ms, start {:.1f}ms".format(
+                ident, config["module"], time_import * 1000, timings[ident]["start"] * 1000))
+        return timings
+
+    @classmethod
+    def getApps(cls) -> list:
+        """
+        :return: list of all loaded apps
+        """
+        return list(cls.global_apps.values()) + list(cls.instanced_apps.values())
+
+    @classmethod
+    def getAppStats(cls, ident) -> AppStats:
+        """
+        Get the statistics object of an app, created on first use
+        :param ident: app ident
+        :return: AppStats
+        """
+        if ident not in cls.stats:
+            cls.stats[ident] = AppStats()
+        return cls.stats[ident]
+
+    @classmethod
+    def getStats(cls, ident=None) -> dict:
+        """
+        Get handle() duration, queue wait, write duration and write-to-ACK percentiles (in seconds),
+        failed writes and message rates of all app instances of an app.
+        :param ident: app ident, None returns the statistics of all apps
+        :return: dict, {"handle": {"count", "mean", "p50", "p90", "p99", "max"}, "queue_wait": {..}, "write": {..},
+        "write_ack": {..}, "write_failures": int, "messages": int, "messages_per_second": float}
+        or {ident: dict} if ident is None
+        """
+        if ident is not None:
+            return cls.getAppStats(ident).snapshot()
+        return {ident: stats.snapshot() for ident, stats in cls.stats.items()}
+
+    @classmethod
+    def resetStats(cls, ident=None):
+        for key in ([ident] if ident is not None else cls.stats):
+            if key in cls.stats:
+                cls.stats[key].reset()  # instances keep their reference
+
+    @staticmethod
+    def getInstancesOfClient(client) -> list:
+        """
+        :param client: Client
+        :return: list of all app instances of the client
+        """
+        return list(client.apps.values())
+
     @classmethod
     def getAppInstance(cls, ident, id, client) -> App:
         """
@@ -53,8 +53,8 @@ class Client(ClientHeader):
         """Client will be removed so clean up and stop everything"""
         await self.closing.wait()
         tasks = []
-        for app in self.apps:
-            tasks.append(asyncio.ensure_future(self.apps[app].stop()))
+        for app in list(self.apps.values()):
+            tasks.append(asyncio.ensure_future(app.stop()))
         try:
             await asyncio.wait_for(asyncio.gather(*tasks), 3)
         except asyncio.TimeoutError:
@@ -66,8 +66,8 @@ class Client(ClientHeader):
         """Just means that the connection to the client is broken"""
         await super().stop()
         tasks = []
-        for app in self.apps:
-            tasks.append(asyncio.ensure_future(self.apps[app].pause()))
+        for app in list(self.apps.values()):
+            tasks.append(asyncio.ensure_future(app.pause()))
         try:
             await asyncio.wait_for(asyncio.gather(*tasks), 3)
         except asyncio.TimeoutError:
@@ -95,22 +95,50 @@ class Client(ClientHeader):
                         continue
                 else:
                     app = self.apps[header[1]]
-                await app.handle(header[2], data)
+                await app.dispatch(header[2], data)  # only waits if the queue of the instance is full
         except asyncio.CancelledError:
             try:
                 self.log.debug("_reader canceled")
             except Exception as e:
                 pass  # logger already removed during removal of objects on shutdown?
 
-    async def write(self, app_ident, app_id, app_header, message, timeout=math.inf, only_with_connection=False, qos=0):
+    def redispatch(self, app_ident, app_id, items):
+        """
+        Hand messages that were queued in a stopped instance to a new instance
+        or to the instance that already replaced it, e.g. after reloading the app.
+        :param app_ident: app identification number
+        :param app_id: unique app instance id
+        :param items: list of queued items
+        """
+        app = self.apps.get(app_id)
+        if app is None:
+            try:
+                app = AppHandler.getAppInstance(app_ident, app_id, self)
+            except Exception as e:
+                self.log.error("Could not redispatch {!s} messages: {!s}".format(len(items), e))
+                return
+            self.apps[app_id] = app
+        for item in items:
+            app.dispatchNowait(item)
+
+    @staticmethod
+    def appHeader(app_ident, app_id, app_header) -> bytearray:
         header = bytearray(2)
         header[0] = app_ident
         header[1] = app_id
         if type(app_header) == bytearray:
-            header.extend(header)
+            header.extend(app_header)
         elif type(app_header) == int:
             if app_header < 256:
                 header.append(app_header)
             else:
                 raise TypeError("App_header should be bytearray or int<256, not {!s}".format(app_header))
+        return header
+
+    def _acknowledged(self, header_len, message, latency):
+        if header_len > 0:
+            AppHandler.getAppStats(int(message[:2], 16)).write_ack.record(latency)  # header[0] is the app ident
+
+    async def write(self, app_ident, app_id, app_header, message, timeout=math.inf, only_with_connection=False, qos=0):
+        header = self.appHeader(app_ident, app_id, app_header)
         return await super().write(header, message, timeout, only_with_connection, qos)
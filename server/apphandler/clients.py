@@ -24,7 +24,7 @@ def getClient(client_id, *args, **kwargs) -> Client:
         return _getNetwork().clients[client_id]
     client = Client(client_id, *args, **kwargs)
     # basically a future client object without a transport/socket
-    _getNetwork().clients[client_id] = client
+    _getNetwork().addClient(client)
     return client
 
 
@@ -38,6 +38,9 @@ class MultipleClientHelper(header_clients.MultipleClientHelper):
     async def readAll(self, timeout=math.inf, only_with_connection=False):
         raise NotImplementedError("This method can't be used with apphandler")  # as apphandler gets all messages
 
+    def readAsCompleted(self, timeout=math.inf, quorum=None, only_with_connection=False):
+        raise NotImplementedError("This method can't be used with apphandler")  # as apphandler gets all messages
+
     async def writeAll(self, app_ident, app_id, header, message, timeout=math.inf, only_with_connection=False,
                        qos=True):
         """
@@ -71,6 +74,23 @@ class MultipleClientHelper(header_clients.MultipleClientHelper):
         res = await asyncio.gather(*tasks)
         return res
 
+    async def broadcast(self, app_ident, app_id, header, message, timeout=math.inf, only_with_connection=False,
+                        qos=True):
+        """
+        Write to all clients of this object the same message, encoding it only once.
+        Clients that don't exist yet will not receive the message.
+        :param app_ident: app identification number
+        :param app_id: unique app instance id
+        :param header: int (one byte) or bytearray, app specific header, if used
+        :param message: str or object that can be converted by json.dumps
+        :param timeout: float
+        :param only_with_connection: bool
+        :param qos: bool
+        :return: list, [ [<client_id>, bool], ...], True/False: message success
+        """
+        return await super().broadcast(Client.appHeader(app_ident, app_id, header), message, timeout,
+                                       only_with_connection, qos)
+
     async def writeClient(self, client_id, app_ident, app_id, header, message, timeout=math.inf,
                           only_with_connection=False, qos=True):
         """
@@ -0,0 +1,63 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2019 Released under the MIT license
+# Created on 2019-03-09
+
+__updated__ = "2019-03-09"
+__version__ = "0.0"
+
+from server.apphandler.apphandler import App, AppInstance
+import asyncio
+
+
+# Request/response apps like a GET request. A client keeps one instance and sends requests as
+# [correlation_id, payload], every response is [correlation_id, result] or [correlation_id, None, error]
+# using the header_byte of the request. The client matches responses by correlation_id so multiple
+# requests can be in flight on one instance and are handled concurrently (see concurrency).
+
+
+class RpcInstance(AppInstance):
+    concurrency = 10  # requests handled concurrently, responses can be sent out of order
+    response_timeout = 60  # seconds to wait for the client connection when sending a response
+
+    def __init__(self, app, id, client):
+        super().__init__(app, id, client)
+        self.response_timeout = app.config.get("response_timeout", self.response_timeout)
+
+    async def handle(self, header_byte, data):
+        """
+        Unpack a request, call request() and send the response.
+        :param header_byte: header_byte of the request, used for the response
+        :param data: [correlation_id, payload]
+        """
+        try:
+            cid, payload = data
+        except (TypeError, ValueError):
+            self.log.error("Malformed request: {!s}".format(data))
+            return
+        try:
+            response = [cid, await self.request(header_byte, payload)]
+        except Exception as e:
+            self.log.error("Error handling request {!s}: {!s}".format(cid, e))
+            response = [cid, None, str(e)]
+        try:
+            if await self.write(header_byte, response, timeout=self.response_timeout):
+                return
+        except asyncio.TimeoutError:
+            pass
+        self.log.warning("Could not send response to request {!s}".format(cid))
+
+    async def request(self, header_byte, payload):
+        """
+        Handle a request and return the result. Raised exceptions are sent to the client as error.
+        Subclass this.
+        :param header_byte: header_byte for the app, if used by the app
+        :param payload: request message
+        :return: result, has to be json serializable
+        """
+        raise NotImplementedError("request() not implemented")
+
+
+class RpcApp(App):
+    def __init__(self, config):
+        super().__init__(config)
+        self.AppInstance = RpcInstance  # overwrite with your RpcInstance subclass
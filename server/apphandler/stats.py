@@ -0,0 +1,113 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2019 Released under the MIT license
+# Created on 2019-03-08
+
+__updated__ = "2019-03-08"
+__version__ = "0.0"
+
+import math
+import time
+
+
+class Histogram:
+    """
+    Histogram of durations with logarithmic buckets, 4 buckets per power of 2 from 1us to ~1h.
+    Recording is O(1) and does not allocate, percentiles are accurate to the bucket width (~19%).
+    """
+    MIN = 1e-6
+    SUBBUCKETS = 4
+    BUCKETS = 32 * SUBBUCKETS
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        """
+        :param value: float, duration in seconds
+        """
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+        if value <= self.MIN:
+            self.counts[0] += 1
+            return
+        i = int(math.log2(value / self.MIN) * self.SUBBUCKETS)
+        self.counts[i if i < self.BUCKETS else self.BUCKETS - 1] += 1
+
+    def percentile(self, p) -> float:
+        """
+        :param p: float, 0-100
+        :return: upper bound of the bucket containing the percentile, 0 if empty
+        """
+        if self.count == 0:
+            return 0.0
+        target = math.ceil(self.count * p / 100)
+        n = 0
+        for i, c in enumerate(self.counts):
+            n += c
+            if n >= target:
+                return min(self.MIN * 2 ** ((i + 1) / self.SUBBUCKETS), self.max)
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {"count": self.count,
+                "mean": self.sum / self.count if self.count else 0.0,
+                "p50": self.percentile(50),
+                "p90": self.percentile(90),
+                "p99": self.percentile(99),
+                "max": self.max}
+
+
+class RateCounter:
+    """Events per second over a sliding window using one slot per second"""
+
+    def __init__(self, window=10):
+        self.window = window
+        self.total = 0
+        self._counts = [0] * window
+        self._seconds = [0] * window
+
+    def add(self, n=1):
+        self.total += n
+        second = int(time.time())
+        i = second % self.window
+        if self._seconds[i] != second:
+            self._seconds[i] = second
+            self._counts[i] = 0
+        self._counts[i] += n
+
+    def rate(self) -> float:
+        now = int(time.time())
+        n = 0
+        for i in range(self.window):
+            if now - self.window < self._seconds[i] <= now:
+                n += self._counts[i]
+        return n / self.window
+
+
+class AppStats:
+    """Latency and throughput statistics of all instances of one app"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.handle = Histogram()  # duration of handle()/handleBatch()/executor calls
+        self.queue_wait = Histogram()  # time messages spent in the instance queue
+        self.write = Histogram()  # duration of successful write() calls, including the ACK if qos is used
+        self.write_ack = Histogram()  # time from sending a qos message until its ACK arrived
+        self.write_failures = 0  # write() calls that failed or timed out
+        self.messages = RateCounter()  # messages received from clients
+
+    def snapshot(self) -> dict:
+        return {"handle": self.handle.snapshot(),
+                "queue_wait": self.queue_wait.snapshot(),
+                "write": self.write.snapshot(),
+                "write_ack": self.write_ack.snapshot(),
+                "write_failures": self.write_failures,
+                "messages": self.messages.total,
+                "messages_per_second": self.messages.rate()}
@@ -9,6 +9,8 @@ from server.apphandler.apphandler import App, AppInstance
 
 
 class EchoInstance(AppInstance):
+    poolable = True  # one-shot instance without state
+
     def __init__(self, app, id, client):
         super().__init__(app, id, client)
 
@@ -0,0 +1,249 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2019 Released under the MIT license
+# Created on 2019-03-10
+
+__updated__ = "2019-03-10"
+__version__ = "0.0"
+
+from .mqtt_async import connack_string
+from .subscriptions import TopicTrie
+import asyncio
+import logging
+
+log = logging.getLogger("MqttBridge")
+
+
+# Bridge mode multiplexes all MqttInstances over a small pool of broker connections instead of
+# one paho client (one TCP connection and one thread) per device.
+# Every MqttInstance gets a BridgeSession that behaves like the paho client it would otherwise use.
+# Incoming publishes are routed to the sessions by a subscription index of the connection.
+
+
+class _Message:
+    __slots__ = ("topic", "payload", "qos", "retain")
+
+    def __init__(self, topic, payload, qos, retain):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+
+
+class BridgeConnection:
+    def __init__(self, config: dict, client_id, client_class, threaded):
+        """
+        Broker connection shared by many BridgeSessions.
+        :param config: mqtt app config
+        :param client_id: client_id of the connection at the broker
+        :param client_class: mqtt client class of the engine
+        :param threaded: True if the callbacks of the client run in a different thread
+        """
+        self.config = config
+        self.client_id = client_id
+        self.sessions = set()  # attached sessions
+        self.connected = False
+        self._loop = asyncio.get_event_loop()
+        self._retained_window = config.get("bridge_retained_window", 2)
+        self._subscriptions = TopicTrie()  # topic filter: {session: qos}
+        self._fresh = {}  # (session, topic filter): deadline for receiving retained messages
+        self._retired = False
+        self._stopped = False
+        self.mqtt = client_class(client_id=client_id)
+        self.mqtt.enable_logger(log)
+        self.mqtt.username_pw_set(config["user"], config["password"])
+        if threaded:
+            # paho callbacks run in the thread of the paho loop, everything else runs in the event loop
+            self.mqtt.on_connect = self._on_connect
+            self.mqtt.on_message = self._on_message
+            self.mqtt.on_disconnect = self._on_disconnect
+        else:
+            self.mqtt.on_connect = lambda client, userdata, flags, rc: self._connected(rc)
+            self.mqtt.on_message = lambda client, userdata, msg: self._route(msg.topic, msg.payload, msg.retain)
+            self.mqtt.on_disconnect = lambda client, userdata, rc: self._disconnected(rc)
+
+    def start(self):
+        self.mqtt.connect_async(self.config["host"], self.config["port"], self.config["keepalive"])
+        self.mqtt.loop_start()
+
+    def retire(self):
+        """Stop the connection once all sessions are detached, e.g. after the app got stopped or reloaded"""
+        self._retired = True
+        if len(self.sessions) == 0:
+            self.stop()
+
+    def stop(self):
+        self._stopped = True
+        # sessions still attached lose their connection uncleanly, so the broker would have sent their wills
+        for session in list(self.sessions):
+            if session.will is not None:
+                self.mqtt.publish(*session.will)
+            self.detach(session)
+            session._attached = False
+            session._disconnected(1)
+        self.mqtt.disconnect()
+        self.mqtt.loop_stop()
+
+    def _on_connect(self, client, userdata, flags, rc):
+        self._loop.call_soon_threadsafe(self._connected, rc)
+
+    def _on_message(self, client, userdata, msg):
+        self._loop.call_soon_threadsafe(self._route, msg.topic, msg.payload, msg.retain)
+
+    def _on_disconnect(self, client, userdata, rc):
+        self._loop.call_soon_threadsafe(self._disconnected, rc)
+
+    def _connected(self, rc):
+        if rc != 0:
+            log.error("{!s}: Error connecting: {!s}".format(self.client_id, connack_string(rc)))
+        else:
+            log.info("{!s}: Connected, {!s} sessions".format(self.client_id, len(self.sessions)))
+            self.connected = True
+            if len(self._subscriptions) > 0:
+                subscriptions = list(self._subscriptions.items())
+                self.mqtt.subscribe([(topic, max(subs.values())) for topic, subs in subscriptions])
+                deadline = self._loop.time() + self._retained_window
+                for topic, subs in subscriptions:
+                    for session in subs:
+                        self._fresh[(session, topic)] = deadline
+        for session in list(self.sessions):
+            session._connected(rc)
+
+    def _disconnected(self, rc):
+        self.connected = False
+        if rc != 0:
+            log.warning("{!s}: Unexpected disconnection".format(self.client_id))
+            for session in list(self.sessions):
+                session._disconnected(rc)
+
+    def _route(self, topic, payload, retain):
+        now = self._loop.time()
+        targets = {}  # dict as ordered set, every session gets a message only once
+        for topic_filter, subs in self._subscriptions.iterMatch(topic):
+            for session in subs:
+                if retain:
+                    # retained messages are sent by the broker on every subscribe of a topic filter,
+                    # only deliver them to sessions that subscribed recently
+                    deadline = self._fresh.get((session, topic_filter))
+                    if deadline is None:
+                        continue
+                    if deadline < now:
+                        del self._fresh[(session, topic_filter)]
+                        continue
+                targets[session] = None
+        if len(targets) > 0:
+            msg = _Message(topic, payload, 0, retain)
+            for session in targets:
+                session._deliver(msg)
+
+    def attach(self, session):
+        self.sessions.add(session)
+
+    def detach(self, session):
+        for topic in session.topics:
+            self.unsubscribe(session, topic)
+        session.topics = {}
+        self.sessions.discard(session)
+        if self._retired and not self._stopped and len(self.sessions) == 0:
+            self.stop()
+
+    def subscribe(self, session, topic, qos):
+        subs = self._subscriptions.get(topic)
+        if subs is None:
+            subs = self._subscriptions[topic] = {}
+        elif subs.get(session) == qos:
+            return  # e.g. resubscribe of all sessions after the connection was reestablished
+        subs[session] = qos
+        self._fresh[(session, topic)] = self._loop.time() + self._retained_window
+        if self.connected:
+            # sent even if already subscribed so the broker sends the retained messages again
+            self.mqtt.subscribe(topic, max(subs.values()))
+
+    def unsubscribe(self, session, topic):
+        subs = self._subscriptions.get(topic)
+        if subs is None or session not in subs:
+            return
+        del subs[session]
+        self._fresh.pop((session, topic), None)
+        if len(subs) == 0:
+            del self._subscriptions[topic]
+            if self.connected:
+                self.mqtt.unsubscribe(topic)
+
+
+class BridgeSession:
+    def __init__(self, connection: BridgeConnection, client_id):
+        """
+        Stand-in for the paho client of one MqttInstance using a shared BridgeConnection.
+        Supports the part of the paho client API used by MqttInstance.
+        The will is kept per session and published if the shared connection is stopped
+        while the session is still attached. A clean disconnect() does not publish the will.
+        :param connection: BridgeConnection
+        :param client_id: client_id of the device
+        """
+        self.connection = connection
+        self.client_id = client_id
+        self.topics = {}  # topic filter: qos
+        self.will = None
+        self.on_connect = None
+        self.on_message = None
+        self.on_disconnect = None
+        self._attached = False
+
+    def enable_logger(self, logger=None):
+        pass
+
+    def username_pw_set(self, username, password=None):
+        pass  # connection uses the credentials of the app config
+
+    def will_set(self, topic, payload=None, qos=0, retain=False):
+        self.will = (topic, payload, qos, retain)
+
+    def connect(self, host=None, port=None, keepalive=None):
+        if not self._attached:
+            self._attached = True
+            self.connection.attach(self)
+            if self.connection.connected:
+                asyncio.get_event_loop().call_soon(self._connected, 0)
+        return 0
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self, force=False):
+        pass
+
+    def disconnect(self):
+        if self._attached:
+            self.connection.detach(self)
+            self._disconnected(0)
+        return 0
+
+    def subscribe(self, topic, qos=0):
+        if not self._attached:
+            return 4, None  # MQTT_ERR_NO_CONN
+        for t, q in ([(topic, qos)] if type(topic) == str else topic):
+            self.topics[t] = q
+            self.connection.subscribe(self, t, q)
+        return 0, None
+
+    def unsubscribe(self, topic):
+        for t in ([topic] if type(topic) == str else topic):
+            self.topics.pop(t, None)
+            self.connection.unsubscribe(self, t)
+        return 0, None
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        return self.connection.mqtt.publish(topic, payload, qos, retain)
+
+    def _connected(self, rc):
+        if self._attached and self.on_connect is not None:
+            self.on_connect(self, None, {}, rc)
+
+    def _disconnected(self, rc):
+        self._attached = self._attached and rc != 0  # stays attached on connection loss
+        if self.on_disconnect is not None:
+            self.on_disconnect(self, None, rc)
+
+    def _deliver(self, msg):
+        if self.on_message is not None:
+            self.on_message(self, None, msg)
@@ -5,14 +5,17 @@
 __updated__ = "2019-02-23"
 __version__ = "0.1"
 
-from server.apphandler.apphandler import App, AppInstance
+from server.apphandler.apphandler import App, AppInstance, AppHandler
 
-from paho.mqtt.client import Client as _MqttClient
-from paho.mqtt.client import connack_string
+from .mqtt_async import connack_string
 from .subscriptions import SubscriptionHandler
+from .bridge import BridgeConnection, BridgeSession
+from .retained import RetainedCache
+from .pacer import ConnectionPacer
+from .outbox import ConflatingOutbox, stateTopic
+from . import mqtt_async
 from server.apphandler.client import Client as _Client
 import asyncio
-import copy
 
 # COMMANDS
 CMD_PUB = 1
@@ -20,6 +23,7 @@ CMD_SUBS = 2
 CMD_UNSUBS = 3
 CMD_WILL = 4
 CMD_WELC = 5
+CMD_ALIAS = 6
 
 
 # TODO: something keeps multiple mqtt instances after connection loss occasionally
@@ -27,37 +31,121 @@ CMD_WELC = 5
 # TODO: build retain value into header? only one bit left in 1 byte app_header
 # Note: Qos for mqtt is 2 by default as host is powerful
 
-class MqttInstance(AppInstance):
+class MqttInstance(ConflatingOutbox, AppInstance):
+    # Messages for the client are conflated per topic, see ConflatingOutbox.
+    # conflation_size and offline_buffer_time can be changed in the app config.
+    offline_buffer_time = 30  # seconds the broker connection is kept after the client disconnected
+    # Topics can be replaced by integer aliases on the client connection, see _ref() and _resolve().
+    # Clients opt in with CMD_ALIAS for messages sent to them, aliases sent by clients are always resolved.
+    topic_aliases = 64  # max aliases defined for messages sent to a client, other topics are sent in full
+    # With a persistent session the broker keeps the subscriptions and queues messages while the instance
+    # is disconnected, so reconnecting does not need to resubscribe. Not used in bridge mode.
+    # The session is removed when the instance stops, except on server shutdown so it survives a restart.
+    persistent_session = True
+
     def __init__(self, app, id, client: _Client):
         super().__init__(app, id, client)
+        self._initOutbox()
+        self.offline_buffer_time = self.app.config.get("offline_buffer_time", self.offline_buffer_time)
+        self._offline_timer = None  # disconnects from the broker if the client does not reconnect in time
+        self.topic_aliases = self.app.config.get("topic_aliases", self.topic_aliases)
+        self._aliases = False  # client opted in to receive topic aliases
+        self._tx_aliases = {}  # topic: alias, defined for messages sent to the client
+        self._rx_aliases = {}  # alias: topic, defined by the client
+        self.persistent_session = self.app.config.get("persistent_session", self.persistent_session)
+        self._broker_session = False  # broker keeps a persistent session of this instance
         self._subscriptions = SubscriptionHandler("Qos", "OnlyRetained")
         self.mqtt_home = self.app.config["mqtt_home"]  # not yet used, needed for device topic support
         self.id = client.client_id
         self.will = None
         self.welc = None
-        self.mqtt = _MqttClient(client_id=self.id)
-        self.mqtt.enable_logger(self.log)
+        if self.app.bridge is not None:
+            self.mqtt = self.app.getBridgeSession(self.id)
+        else:
+            self.mqtt = self.app.MqttClient(client_id=self.id, clean_session=not self.persistent_session)
         self.mqtt.username_pw_set(self.app.config["user"], self.app.config["password"])
-        self.mqtt.on_connect = self._connected
-        self.mqtt.on_message = self._execute_sync
-        self.mqtt.on_disconnect = self._on_disconnect
+        self._bindMqtt()
         self._client_connected = True
         self._isconnected = False
+        self._connack = asyncio.Event()  # set on every CONNACK
         self.loop = asyncio.get_event_loop()
+        self._threaded = self.app.threaded and self.app.bridge is None  # bridge calls back in the event loop
         self._first_connect = True
 
+    def _bindMqtt(self):
+        self.mqtt.enable_logger(self.log)
+        self.mqtt.on_connect = self._connected
+        self.mqtt.on_message = self._execute_sync
+        self.mqtt.on_disconnect = self._on_disconnect
+
+    def migrate(self, old):
+        """
+        Take over the broker connection and subscriptions of the instance of the previous app version
+        so reloading the app does not reconnect to the broker or publish the will.
+        :param old: MqttInstance
+        """
+        super().migrate(old)
+        self.mqtt = old.mqtt  # client created in __init__ was never connected
+        self._bindMqtt()
+        self._subscriptions = old._subscriptions
+        self.will = old.will
+        self.welc = old.welc
+        self._client_connected = old._client_connected
+        self._isconnected = old._isconnected
+        self._first_connect = old._first_connect
+        self._broker_session = old._broker_session
+        self._migrateOutbox(old)
+        self._aliases = old._aliases
+        self._tx_aliases = old._tx_aliases
+        self._rx_aliases = old._rx_aliases
+        if old._offline_timer is not None:
+            old._offline_timer.cancel()
+            self._offline_timer = self.loop.call_later(max(old._offline_timer.when() - self.loop.time(), 0),
+                                                       self._disconnectOffline)
+            old._offline_timer = None
+        old.mqtt = None
+        old._client_connected = False  # old instance must not publish the will or disconnect on stop
+        self._startSender()
+
     def _connected(self, client, userdata, flags, rc):
         self._first_connect = False
         if rc == 0:
             self.log.info("Connection returned result: {!s}".format(connack_string(rc)))
             self._isconnected = True
+            self._broker_session = self.persistent_session and self.app.bridge is None
             if self._first_connect is False:
-                asyncio.run_coroutine_threadsafe(self._subscribeTopics(), self.loop)
+                if not flags.get("session present"):  # persistent session still has the subscriptions
+                    self._schedule(self._subscribeTopics())
                 if self.welc is not None:
                     self.mqtt.publish(*self.welc)
         else:
             self._isconnected = False
             self.log.error("Error connecting: {!s}".format(connack_string(rc)))
+        if self._threaded:
+            self.loop.call_soon_threadsafe(self._connack.set)
+        else:
+            self._connack.set()
+
+    async def _connect(self):
+        """Connect to the broker and wait for CONNACK, paced by the app to spread connects of many instances"""
+        if self.app.bridge is not None:
+            self.mqtt.connect()  # attaches the session to a shared connection, nothing to pace
+            return
+        async with self.app.pacer:
+            if self._isconnected:
+                return  # connected while waiting for the pacer
+            self._connack.clear()
+            self.log.debug("Connecting")
+            config = self.app.config
+            # paho connects in the thread of its loop instead of blocking the event loop
+            self.mqtt.connect_async(config["host"], config["port"], config["keepalive"])
+            self.log.debug("Starting loop")
+            self.mqtt.loop_start()
+            self.log.debug("Loop started")
+            try:
+                await asyncio.wait_for(self._connack.wait(), self.app.pacer.timeout)
+            except asyncio.TimeoutError:
+                self.log.warn("No CONNACK after {!s}s".format(self.app.pacer.timeout))
 
     def _on_disconnect(self, client, userdata, rc):
         if rc != 0:
@@ -65,34 +153,78 @@ class MqttInstance(AppInstance):
         self._isconnected = False
 
     async def _subscribeTopics(self):
-        for subs in self._subscriptions.subs:
-            q = self._subscriptions.subs[subs]["Qos"]
-            try:
-                self.mqtt.subscribe(subs, q)
-            except Exception as e:
-                self.log.error("Resubscribing: {!s}".format(e))
+        subs = self._subscriptions.subs
+        if len(subs) == 0:
+            return
+        try:
+            self.mqtt.subscribe([(topic, subs[topic]["Qos"]) for topic in subs])  # one SUBSCRIBE packet
+        except Exception as e:
+            self.log.error("Resubscribing: {!s}".format(e))
+
+    def _schedule(self, coro):
+        """Run a coroutine from a mqtt callback, which runs in the thread of the paho loop if paho is used"""
+        if self._threaded:
+            asyncio.run_coroutine_threadsafe(coro, self.loop)
+        else:
+            asyncio.ensure_future(coro)
 
     def _execute_sync(self, client, userdata, msg):
-        asyncio.run_coroutine_threadsafe(self._execute(msg.topic, msg.payload, msg.retain), self.loop)
+        self._schedule(self._execute(msg.topic, msg.payload, msg.retain))
 
     async def _execute(self, topic, msg, retain):
         self.log.debug("mqtt execution: {!s} {!s} {!s}".format(topic, msg, retain))
         msg = msg.decode()
         unsub = []
-        topics = self._subscriptions.get(topic, "OnlyRetained")
+        try:
+            topics = self._subscriptions.get(topic, "OnlyRetained")
+        except ValueError:
+            # e.g. queued by the persistent session for a topic the client did not subscribe again
+            self.log.debug("Topic {!s} not subscribed, discarding message".format(topic))
+            return
         for t in topics:
             if topics[t] is True:
                 self._subscriptions.removeObject(t)
                 unsub.append(t)
         if len(unsub) > 0:
             self.mqtt.unsubscribe(unsub)
-        try:
-            await self.write(0, [topic, list(topics.keys()), msg, retain], timeout=5)
-            # header 0 as not used as this is the only message type clients ever receive from this app
-        except asyncio.TimeoutError:
-            self.log.info("Timeout writing client: {!s},{!s}".format(topic, msg))
-        except Exception as e:
-            self.log.error("Error writing client: {!s}".format(e))
+        self._conflate(topic, [topic, list(topics.keys()), msg, retain])
+
+    async def _writeMessage(self, message) -> bool:
+        if self._aliases:
+            # encoded right before sending so aliases are defined in the order the client receives them
+            message = [self._ref(message[0]), [self._ref(t) for t in message[1]], message[2], message[3]]
+        return await super()._writeMessage(message)
+
+    def _writeFailed(self):
+        self._tx_aliases = {}  # message might have contained an alias definition
+
+    def _ref(self, topic):
+        """
+        Reference of a topic for a message to the client.
+        :param topic: str
+        :return: int alias, {topic: alias} defining the alias on first use or topic if no aliases are left
+        """
+        alias = self._tx_aliases.get(topic)
+        if alias is not None:
+            return alias
+        if len(self._tx_aliases) >= self.topic_aliases:
+            return topic
+        alias = self._tx_aliases[topic] = len(self._tx_aliases)
+        return {topic: alias}
+
+    def _resolve(self, ref):
+        """
+        Topic of a reference sent by the client, see _ref().
+        :param ref: str, int or {topic: alias}
+        :return: str
+        """
+        if type(ref) == int:
+            return self._rx_aliases[ref]
+        if type(ref) == dict:
+            topic, alias = next(iter(ref.items()))
+            self._rx_aliases[alias] = topic
+            return topic
+        return ref
 
     def _unsubscribe(self, topics: list):
         if type(topics) != list:
@@ -110,56 +242,64 @@ class MqttInstance(AppInstance):
     def _publish(self, topic, msg, retain=False):
         self.mqtt.publish(topic, msg, qos=2, retain=retain)
 
-    async def _getRetainedStateTopic(self, topic: str):
-        if topic.endswith("/set"):
-            state_topic = topic[:-4]
-            sub = self._subscriptions.addObject(state_topic)
-            sub["OnlyRetained"] = True
-            self.mqtt.subscribe(state_topic, qos=2)
-        else:
-            # not a command topic, topic therefore already in subscriptionHandler
-            self.mqtt.subscribe(topic, qos=2)
+    async def _sendRetainedState(self, state_topic: str):
+        """
+        Send the current state of a command topic to the client, taken from the retained cache of the app
+        :param state_topic: command topic without "/set"
+        """
+        app = self.app
+        if app is None:
+            return  # stopped before this task started
+        msg = await app.retained.get(state_topic)
+        if msg is None or self.app is None:
             return
-        await asyncio.sleep(0.1)
-        try:
-            t = self._subscriptions.removeObject(topic[:-4])
-        except ValueError:
-            return  # already got the state topic and was removed
-        else:
-            self.mqtt.unsubscribe(topic)
+        self._conflate(state_topic, [state_topic, [state_topic], msg, True])
 
     def _subscribe(self, topics, check_state_topic=True):
+        """
+        :param topics: str or list of topics, a list is subscribed with one SUBSCRIBE packet
+        :param check_state_topic: send the current state of command topics
+        """
         if type(topics) != list:
             topics = [topics]
-        topics_new = copy.deepcopy(topics)
-        for topic in topics_new:
-            try:
-                if self._subscriptions.get(topic, "Qos", equal=True):
-                    topics.remove(topic)
-                    continue
-            except ValueError:
-                pass
+        new = []
         for topic in topics:
-            sub = self._subscriptions.addObject(topic)
-            sub["OnlyRetained"] = False
-            if check_state_topic is True and topic.endswith("/set"):
-                asyncio.ensure_future(self._getRetainedStateTopic(topic))
-            else:
-                self.mqtt.subscribe(topic)
+            if self._subscriptions.getObject(topic) is not None:
+                continue  # e.g. client resubscribing after reconnecting within offline_buffer_time
+            self._subscriptions.addObject(topic, {"Qos": 2, "OnlyRetained": False})
+            new.append((topic, 2))
+        if len(new) > 0:
+            self.mqtt.subscribe(new)
+        for topic, qos in new:
+            if check_state_topic is True and stateTopic(topic) is not None:
+                asyncio.ensure_future(self._sendRetainedState(stateTopic(topic)))
 
     async def stop(self):
         """
         Stop mqtt client, remove instance
         :return:
         """
-        if self._client_connected:
+        if self._offline_timer is not None:
+            self._offline_timer.cancel()
+            self._offline_timer = None
+            self._disconnect()  # will was already published in pause()
+        elif self._client_connected:
             # typically client is not connected anymore except on shutdown
             if self.will is not None:
                 self._publish(*self.will)
             self.mqtt.disconnect()
             self.mqtt.loop_stop()
+        self._client_connected = False
+        self._stopSender()
+        # instance won't resume the session, otherwise the broker keeps its subscriptions and queued messages.
+        # On shutdown the session is kept for the restarted server.
+        clean_session = self._broker_session and self.mqtt is not None and not AppHandler.stop_event.is_set()
+        self._broker_session = False
+        app = self.app
         await super().stop()
         self.mqtt = None
+        if clean_session:
+            await app.cleanSession(self.id)
 
     def start(self):
         """
@@ -169,23 +309,48 @@ class MqttInstance(AppInstance):
         self._client_connected = True
         self._first_connect = True
         self.log.debug("(Re)starting")
+        self._tx_aliases = {}  # client might have lost its aliases, redefine them on first use
+        if self._offline_timer is not None:
+            # broker connection was kept, send the messages buffered while the client was offline
+            self._offline_timer.cancel()
+            self._offline_timer = None
+            self.log.debug("Sending {!s} buffered messages".format(len(self._outbox)))
+        self._startSender()
         # reconnect handled on first new message to support last will sent with first message
 
     async def pause(self):
         """
-        Connection to client broken, discard all qos==0 messages and duplicates.
-        Stop sending new messages.
+        Connection to client broken, stop sending new messages.
+        The broker connection is kept for offline_buffer_time seconds, buffering the newest message
+        of each topic in case the client reconnects.
         :return:
         """
+        if not self._client_connected:
+            return  # already paused, e.g. stop() of the client and connection_lost both pause
         self.log.debug("Pausing")
         self._first_connect = True
         if self.will is not None:
             self._publish(*self.will)
         self._client_connected = False
+        if self._offline_timer is not None:
+            self._offline_timer.cancel()
+        if self.offline_buffer_time > 0:
+            self._offline_timer = self.loop.call_later(self.offline_buffer_time, self._disconnectOffline)
+        else:
+            self._disconnect()
+
+    def _disconnectOffline(self):
+        self._offline_timer = None
+        self.log.debug("Client did not reconnect, disconnecting from broker")
+        self._disconnect()
+
+    def _disconnect(self):
         self.mqtt.disconnect()
         self.mqtt.loop_stop()
-        # unsubscribe as client will resubscribe anyway and could subscribe to different topics.
-        self._subscriptions.removeAll()
+        if not self.persistent_session or self.app.bridge is not None:
+            # unsubscribe as client will resubscribe anyway and could subscribe to different topics.
+            self._subscriptions.removeAll()
+        self._outbox.clear()  # stale after a long disconnect, client gets current states on subscribing
 
     async def handle(self, header_byte, data):
         """
@@ -195,15 +360,22 @@ class MqttInstance(AppInstance):
         :return:
         """
         self.log.debug("Got header {!s}, data {!s}".format(header_byte, data))
+        try:
+            if header_byte in (CMD_PUB, CMD_WILL, CMD_WELC, CMD_SUBS) and data is not None:
+                if type(data[0]) == list:
+                    data[0] = [self._resolve(ref) for ref in data[0]]  # list of topics
+                else:
+                    data[0] = self._resolve(data[0])
+            elif header_byte == CMD_UNSUBS:
+                data = [self._resolve(ref) for ref in data] if type(data) == list else self._resolve(data)
+        except KeyError as e:
+            self.log.error("Unknown topic alias {!s}, discarding message".format(e))
+            return
         if self._isconnected is False:
             if header_byte == CMD_WILL:  # if first message is will, then it can be send to broker
                 if data is not None:
                     self.mqtt.will_set(*data)
-            self.log.debug("Connecting")
-            self.mqtt.connect(self.app.config["host"], self.app.config["port"], self.app.config["keepalive"])
-            self.log.debug("Starting loop")
-            self.mqtt.loop_start()
-            self.log.debug("Loop started")
+            await self._connect()
         if header_byte == CMD_UNSUBS:
             self._unsubscribe(data)
         elif header_byte == CMD_SUBS:
@@ -215,6 +387,9 @@ class MqttInstance(AppInstance):
         elif header_byte == CMD_WELC:
             self.welc = data
             self._publish(*data)
+        elif header_byte == CMD_ALIAS:
+            self._aliases = True
+            self._tx_aliases = {}
         else:
             self.log.error("No command for header {!s}".format(header_byte))
 
@@ -223,7 +398,72 @@ class Mqtt(App):
     def __init__(self, config):
         super().__init__(config)
         self.AppInstance = MqttInstance
+        # "asyncio" runs the mqtt clients on the event loop, "paho" uses paho clients with one thread each
+        self.engine = config.get("engine", "asyncio")
+        if self.engine == "paho":
+            from paho.mqtt.client import Client as MqttClient
+            self.MqttClient = MqttClient
+            self.threaded = True
+        elif self.engine == "asyncio":
+            self.MqttClient = mqtt_async.Client
+            self.threaded = False
+        else:
+            raise ValueError("Unknown mqtt engine {!s}".format(self.engine))
+        self.bridge = None  # list of BridgeConnection shared by all instances if bridge mode is active
+        if config.get("bridge", False):
+            self.bridge = [BridgeConnection(config, "{!s}_bridge_{!s}".format(config.get("bridge_id", "iot"), i),
+                                            self.MqttClient, self.threaded)
+                           for i in range(config.get("bridge_connections", 4))]
+        self._next_bridge = 0
+        self.pacer = ConnectionPacer(config.get("connect_concurrency", 10), config.get("connect_jitter", 1),
+                                     config.get("connect_timeout", 5))
+        # current state of command topics for new subscriptions, connects on first use
+        self.retained = RetainedCache(config, "{!s}_retained".format(config.get("bridge_id", "iot")),
+                                      self.MqttClient, self.threaded)
+
+    def start(self):
+        super().start()
+        if self.bridge is not None:
+            for connection in self.bridge:
+                connection.start()
+
+    async def cleanSession(self, client_id):
+        """
+        Remove the persistent session of a client at the broker by connecting once with a clean session
+        :param client_id: client_id of the session
+        """
+        mqtt = self.MqttClient(client_id=client_id, clean_session=True)
+        mqtt.username_pw_set(self.config["user"], self.config["password"])
+        connack = asyncio.Event()
+        loop = asyncio.get_event_loop()
+        if self.threaded:
+            mqtt.on_connect = lambda client, userdata, flags, rc: loop.call_soon_threadsafe(connack.set)
+        else:
+            mqtt.on_connect = lambda client, userdata, flags, rc: connack.set()
+        try:
+            async with self.pacer:
+                mqtt.connect_async(self.config["host"], self.config["port"], self.config["keepalive"])
+                mqtt.loop_start()
+                await asyncio.wait_for(connack.wait(), self.pacer.timeout)
+        except asyncio.TimeoutError:
+            self.log.warn("Could not remove the broker session of {!s}".format(client_id))
+        finally:
+            mqtt.disconnect()
+            mqtt.loop_stop()
+
+    def getBridgeSession(self, client_id) -> BridgeSession:
+        """
+        Create a session, connections are assigned round robin
+        :param client_id: client_id of the device
+        :return: BridgeSession
+        """
+        self._next_bridge = (self._next_bridge + 1) % len(self.bridge)
+        return BridgeSession(self.bridge[self._next_bridge], client_id)
 
     async def stop(self):
         """Extend with your own code but call stop method of base class to prevent RAM leak and to stop instances"""
         await super().stop()
+        self.retained.stop()
+        if self.bridge is not None:
+            for connection in self.bridge:
+                connection.retire()  # sessions migrated to a reloaded app keep using the connection
@@ -0,0 +1,371 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2019 Released under the MIT license
+# Created on 2019-03-11
+
+__updated__ = "2019-03-11"
+__version__ = "0.0"
+
+import asyncio
+import logging
+import struct
+
+log = logging.getLogger("MqttAsync")
+
+# MQTT 3.1.1 client running on the event loop without threads.
+# Mirrors the part of the paho client API used by the mqtt app so both can be exchanged:
+# callbacks on_connect(client, userdata, flags, rc), on_message(client, userdata, msg) and
+# on_disconnect(client, userdata, rc) are called directly in the event loop.
+# connect() returns immediately and the client reconnects automatically until disconnect() is called.
+# Packets sent before the connection is established are queued and sent after CONNACK.
+
+CONNECT = 0x10
+CONNACK = 0x20
+PUBLISH = 0x30
+PUBACK = 0x40
+PUBREC = 0x50
+PUBREL = 0x62
+PUBCOMP = 0x70
+SUBSCRIBE = 0x82
+SUBACK = 0x90
+UNSUBSCRIBE = 0xA2
+UNSUBACK = 0xB0
+PINGREQ = 0xC0
+PINGRESP = 0xD0
+DISCONNECT = 0xE0
+
+MQTT_ERR_SUCCESS = 0
+MQTT_ERR_NO_CONN = 4
+
+_CONNACK_STRINGS = {0: "Connection Accepted.",
+                    1: "Connection Refused: unacceptable protocol version.",
+                    2: "Connection Refused: identifier rejected.",
+                    3: "Connection Refused: broker unavailable.",
+                    4: "Connection Refused: bad user name or password.",
+                    5: "Connection Refused: not authorised."}
+
+
+def connack_string(rc) -> str:
+    return _CONNACK_STRINGS.get(rc, "Connection Refused: unknown reason.")
+
+
+def _string(s) -> bytes:
+    if type(s) == str:
+        s = s.encode()
+    return struct.pack("!H", len(s)) + s
+
+
+def _payload(payload) -> bytes:
+    if payload is None:
+        return b""
+    if type(payload) == str:
+        return payload.encode()
+    if type(payload) in (int, float):
+        return str(payload).encode()
+    return bytes(payload)
+
+
+def _packet(header, body) -> bytes:
+    length = len(body)
+    remaining = bytearray()
+    while True:
+        b = length % 128
+        length //= 128
+        remaining.append(b | 0x80 if length > 0 else b)
+        if length == 0:
+            break
+    return bytes([header]) + remaining + body
+
+
+class MQTTMessage:
+    __slots__ = ("topic", "payload", "qos", "retain", "mid")
+
+    def __init__(self, topic, payload, qos=0, retain=False, mid=0):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.mid = mid
+
+
+class _Protocol(asyncio.Protocol):
+    def __init__(self, client):
+        self.client = client
+
+    def connection_made(self, transport):
+        self.client._connectionMade(self, transport)
+
+    def data_received(self, data):
+        self.client._dataReceived(data)
+
+    def connection_lost(self, exc):
+        self.client._connectionLost(self, exc)
+
+
+class Client:
+    def __init__(self, client_id="", clean_session=True, userdata=None):
+        self._client_id = client_id
+        self._clean_session = clean_session
+        self._userdata = userdata
+        self._log = log
+        self._username = None
+        self._password = None
+        self._will = None
+        self._host = None
+        self._port = 1883
+        self._keepalive = 60
+        self.on_connect = None
+        self.on_message = None
+        self.on_disconnect = None
+        self._loop = asyncio.get_event_loop()
+        self._transport = None
+        self._protocol = None  # _Protocol of the current connection
+        self._buffer = bytearray()
+        self._connected = False
+        self._disconnect_requested = True
+        self._connect_task = None
+        self._keepalive_task = None
+        self._last_tx = 0
+        self._last_rx = 0
+        self._mid = 0
+        self._outbox = []  # (packet, mid) queued until the connection is established
+        self._inflight = {}  # mid: packet, outgoing qos>0 messages that are not yet acknowledged
+        self._incoming_qos2 = set()  # mids of received qos 2 messages waiting for PUBREL
+
+    def enable_logger(self, logger=None):
+        self._log = logger or log
+
+    def username_pw_set(self, username, password=None):
+        self._username = username
+        self._password = password
+
+    def will_set(self, topic, payload=None, qos=0, retain=False):
+        self._will = (topic, _payload(payload), qos, retain)
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def connect(self, host, port=1883, keepalive=60):
+        """Start connecting, returns immediately. Reconnects automatically until disconnect() is called."""
+        self._host = host
+        self._port = port
+        self._keepalive = keepalive
+        self._disconnect_requested = False
+        if self._connect_task is None and self._protocol is None:
+            self._connect_task = asyncio.ensure_future(self._connectLoop())
+        return MQTT_ERR_SUCCESS
+
+    connect_async = connect
+
+    def loop_start(self):
+        pass  # runs on the event loop, no thread needed
+
+    def loop_stop(self, force=False):
+        pass
+
+    def disconnect(self):
+        self._disconnect_requested = True
+        self._outbox = []
+        self._inflight = {}
+        if self._connect_task is not None:
+            self._connect_task.cancel()
+            self._connect_task = None
+        if self._protocol is not None:
+            if self._connected:
+                self._write(_packet(DISCONNECT, b""))
+            self._transport.close()
+            self._closed()
+            if self.on_disconnect is not None:
+                self.on_disconnect(self, self._userdata, 0)
+        return MQTT_ERR_SUCCESS
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        mid = self._nextMid() if qos > 0 else 0
+        body = _string(topic) + (struct.pack("!H", mid) if qos > 0 else b"") + _payload(payload)
+        self._send(_packet(PUBLISH | qos << 1 | (1 if retain else 0), body), mid)
+        return MQTT_ERR_SUCCESS, mid
+
+    def subscribe(self, topic, qos=0):
+        """
+        :param topic: str or list of (topic, qos)
+        :param qos: int, only used if topic is a str
+        """
+        topics = [(topic, qos)] if type(topic) == str else topic
+        mid = self._nextMid()
+        body = struct.pack("!H", mid) + b"".join(_string(t) + bytes([q]) for t, q in topics)
+        self._send(_packet(SUBSCRIBE, body))
+        return MQTT_ERR_SUCCESS, mid
+
+    def unsubscribe(self, topic):
+        """
+        :param topic: str or list of str
+        """
+        topics = [topic] if type(topic) == str else topic
+        mid = self._nextMid()
+        self._send(_packet(UNSUBSCRIBE, struct.pack("!H", mid) + b"".join(_string(t) for t in topics)))
+        return MQTT_ERR_SUCCESS, mid
+
+    def _nextMid(self) -> int:
+        self._mid = self._mid % 65535 + 1
+        return self._mid
+
+    def _send(self, packet, mid=0):
+        if self._connected:
+            if mid:
+                self._inflight[mid] = packet
+            self._write(packet)
+        elif not self._disconnect_requested:
+            self._outbox.append((packet, mid))
+
+    def _write(self, packet):
+        self._last_tx = self._loop.time()
+        self._transport.write(packet)
+
+    async def _connectLoop(self):
+        delay = 1
+        try:
+            while not self._disconnect_requested:
+                try:
+                    await self._loop.create_connection(lambda: _Protocol(self), self._host, self._port)
+                    return
+                except OSError as e:
+                    self._log.error("Error connecting to {!s}:{!s}: {!s}".format(self._host, self._port, e))
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 120)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if self._connect_task is asyncio.current_task():
+                self._connect_task = None
+
+    def _connectionMade(self, protocol, transport):
+        self._protocol = protocol
+        self._transport = transport
+        self._buffer = bytearray()
+        self._last_rx = self._loop.time()
+        flags = 0x02 if self._clean_session else 0
+        payload = _string(self._client_id)
+        if self._will is not None:
+            topic, message, qos, retain = self._will
+            flags |= 0x04 | qos << 3 | (0x20 if retain else 0)
+            payload += _string(topic) + _string(message)
+        if self._username is not None:
+            flags |= 0x80
+            payload += _string(self._username)
+            if self._password is not None:
+                flags |= 0x40
+                payload += _string(self._password)
+        self._write(_packet(CONNECT, _string("MQTT") + bytes([4, flags]) + struct.pack("!H", self._keepalive) +
+                            payload))
+        if self._keepalive > 0:  # 0 disables keepalive
+            self._keepalive_task = asyncio.ensure_future(self._keepaliveLoop())
+
+    def _closed(self):
+        self._protocol = None
+        self._transport = None
+        self._connected = False
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+
+    def _connectionLost(self, protocol, exc):
+        if protocol is not self._protocol:
+            return  # closed by disconnect(), which already called on_disconnect
+        self._closed()
+        self._log.warning("Connection lost: {!s}".format(exc))
+        if not self._disconnect_requested:
+            self._connect_task = asyncio.ensure_future(self._connectLoop())
+        if self.on_disconnect is not None:
+            self.on_disconnect(self, self._userdata, 1)
+
+    async def _keepaliveLoop(self):
+        try:
+            while self._transport is not None:
+                await asyncio.sleep(self._keepalive / 4)
+                now = self._loop.time()
+                if now - self._last_rx > self._keepalive * 1.5:
+                    self._log.warning("Keepalive timeout")
+                    self._transport.abort()
+                    return
+                if self._connected and now - self._last_tx > self._keepalive / 2:
+                    self._write(_packet(PINGREQ, b""))
+        except asyncio.CancelledError:
+            pass
+
+    def _dataReceived(self, data):
+        self._last_rx = self._loop.time()
+        buf = self._buffer
+        buf += data
+        while len(buf) >= 2:
+            length = 0
+            multiplier = 1
+            i = 1
+            while True:
+                if i >= len(buf):
+                    return  # incomplete remaining length
+                b = buf[i]
+                length += (b & 0x7F) * multiplier
+                multiplier *= 128
+                i += 1
+                if b & 0x80 == 0:
+                    break
+            if len(buf) < i + length:
+                return
+            header = buf[0]
+            body = bytes(buf[i:i + length])
+            del buf[:i + length]
+            try:
+                self._handlePacket(header, body)
+            except Exception as e:
+                self._log.error("Error handling packet {!s}: {!s}".format(hex(header), e))
+
+    def _handlePacket(self, header, body):
+        packet_type = header & 0xF0
+        if packet_type == PUBLISH:
+            qos = (header >> 1) & 0x03
+            topic_length = struct.unpack_from("!H", body)[0]
+            topic = body[2:2 + topic_length].decode()
+            pos = 2 + topic_length
+            mid = 0
+            if qos > 0:
+                mid = struct.unpack_from("!H", body, pos)[0]
+                pos += 2
+            if qos == 1:
+                self._write(_packet(PUBACK, struct.pack("!H", mid)))
+            elif qos == 2:
+                self._write(_packet(PUBREC, struct.pack("!H", mid)))
+                if mid in self._incoming_qos2:
+                    return  # duplicate, already delivered
+                self._incoming_qos2.add(mid)
+            if self.on_message is not None:
+                self.on_message(self, self._userdata, MQTTMessage(topic, body[pos:], qos, bool(header & 0x01), mid))
+        elif packet_type == PUBACK or packet_type == PUBCOMP:
+            self._inflight.pop(struct.unpack("!H", body)[0], None)
+        elif packet_type == PUBREC:
+            mid = struct.unpack("!H", body)[0]
+            packet = _packet(PUBREL, body)
+            self._inflight[mid] = packet  # PUBREL is resent on reconnect until PUBCOMP
+            self._write(packet)
+        elif packet_type == PUBREL & 0xF0:
+            self._incoming_qos2.discard(struct.unpack("!H", body)[0])
+            self._write(_packet(PUBCOMP, body))
+        elif packet_type == CONNACK:
+            self._connack(body[0], body[1])
+        # SUBACK, UNSUBACK and PINGRESP need no handling
+
+    def _connack(self, flags, rc):
+        if rc != 0:
+            self._log.error("Error connecting: {!s}".format(connack_string(rc)))
+            if self.on_connect is not None:
+                self.on_connect(self, self._userdata, {"session present": 0}, rc)
+            return
+        self._connected = True
+        for mid, packet in list(self._inflight.items()):
+            if packet[0] & 0xF0 == PUBLISH:
+                packet = bytes([packet[0] | 0x08]) + packet[1:]  # DUP flag
+                self._inflight[mid] = packet
+            self._write(packet)
+        outbox, self._outbox = self._outbox, []
+        for packet, mid in outbox:
+            self._send(packet, mid)
+        if self.on_connect is not None:
+            self.on_connect(self, self._userdata, {"session present": flags & 0x01}, rc)
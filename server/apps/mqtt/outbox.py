@@ -0,0 +1,97 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2019 Released under the MIT license
+# Created on 2019-03-17
+
+__updated__ = "2019-03-17"
+__version__ = "0.0"
+
+import asyncio
+import collections
+
+
+def stateTopic(topic):
+    """
+    State topic of a command topic, used to send the current state to clients subscribing to a command topic
+    :param topic: str
+    :return: topic without "/set" or None if topic is no command topic
+    """
+    if topic.endswith("/set") and "+" not in topic and "#" not in topic:
+        return topic[:-4]
+    return None
+
+
+class ConflatingOutbox:
+    """
+    Mixin for AppInstances sending mqtt messages [topic, subscriptions, msg, retain] to their client.
+    Messages are conflated per topic: while the client is slow or offline, only the newest
+    message of each topic is kept and sent once the client can receive it again.
+    The AppInstance sets self._client_connected and calls _startSender() when the client reconnects.
+    """
+    conflation_size = 100  # max topics waiting to be sent, messages of the oldest topic get dropped if exceeded
+    write_timeout = 5
+
+    def _initOutbox(self):
+        self.conflation_size = self.app.config.get("conflation_size", self.conflation_size)
+        self._outbox = collections.OrderedDict()  # topic: message, in order of the newest message
+        self._sender = None  # task sending the outbox to the client
+
+    def _migrateOutbox(self, old):
+        self._outbox, old._outbox = old._outbox, collections.OrderedDict()
+
+    def _stopSender(self):
+        if self._sender is not None:
+            self._sender.cancel()
+        self._outbox.clear()
+
+    def _conflate(self, topic, message):
+        """
+        Queue a message for the client, an unsent message of the same topic gets replaced.
+        :param topic: str
+        :param message: [topic, subscriptions, msg, retain]
+        """
+        if topic in self._outbox:
+            del self._outbox[topic]  # newest message is sent in the order it arrived
+        elif len(self._outbox) >= self.conflation_size:
+            dropped, _ = self._outbox.popitem(last=False)
+            self.log.warn("Outbox full, dropping message of {!s}".format(dropped))
+        self._outbox[topic] = message
+        self._startSender()
+
+    def _startSender(self):
+        if self._sender is None and self._client_connected and len(self._outbox) > 0:
+            self._sender = asyncio.ensure_future(self._send())
+
+    async def _writeMessage(self, message) -> bool:
+        """
+        Override to change the message before it is sent
+        :param message: [topic, subscriptions, msg, retain]
+        :return: bool, result of write()
+        """
+        # header 0 as not used as this is the only message type clients ever receive from these apps
+        return await self.write(0, message, timeout=self.write_timeout)
+
+    def _writeFailed(self):
+        """Override to reset state that depends on messages the client might not have received"""
+        pass
+
+    async def _send(self):
+        try:
+            while len(self._outbox) > 0 and self._client_connected:
+                topic, message = self._outbox.popitem(last=False)
+                try:
+                    ret = await self._writeMessage(message)
+                except asyncio.TimeoutError:
+                    ret = False
+                except Exception as e:
+                    self.log.error("Error writing client: {!s}".format(e))
+                    continue
+                if not ret:
+                    self.log.info("Could not write client: {!s},{!s}".format(topic, message[2]))
+                    self._writeFailed()
+                    if topic not in self._outbox and len(self._outbox) < self.conflation_size:
+                        # retry first unless a newer message of the topic arrived meanwhile
+                        self._outbox[topic] = message
+                        self._outbox.move_to_end(topic, last=False)
+                    return  # sent again with the next message or when the client reconnects
+        finally:
+            self._sender = None
@@ -0,0 +1,45 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2019 Released under the MIT license
+# Created on 2019-03-14
+
+__updated__ = "2019-03-14"
+__version__ = "0.0"
+
+import asyncio
+import random
+
+
+class ConnectionPacer:
+    """
+    Limits how many broker connections of the mqtt app are established at the same time.
+    After a server restart all devices reconnect at once, without a limit the broker gets all connects
+    at the same moment. Connects waiting for a free slot start with a random delay so they don't
+    arrive at the broker in bursts once slots get free.
+    """
+
+    def __init__(self, concurrency=10, jitter=1, timeout=5):
+        """
+        :param concurrency: int, max connects waiting for CONNACK at the same time
+        :param jitter: float, max random delay in seconds of a connect that had to wait for a slot
+        :param timeout: float, seconds a connect keeps its slot while waiting for CONNACK
+        """
+        self.concurrency = concurrency
+        self.jitter = jitter
+        self.timeout = timeout
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def __aenter__(self):
+        if self._semaphore.locked() or self.waiting > 0:
+            self.waiting += 1
+            try:
+                await asyncio.sleep(random.uniform(0, self.jitter))
+                await self._semaphore.acquire()
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._semaphore.release()
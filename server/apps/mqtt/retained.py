@@ -0,0 +1,126 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2019 Released under the MIT license
+# Created on 2019-03-13
+
+__updated__ = "2019-03-13"
+__version__ = "0.0"
+
+import asyncio
+import collections
+import logging
+
+log = logging.getLogger("MqttRetained")
+
+
+class RetainedCache:
+    def __init__(self, config: dict, client_id, client_class, threaded):
+        """
+        Last value of state topics shared by all MqttInstances, used to send the current state
+        to devices subscribing to the command topic (state topic + "/set").
+        A topic gets subscribed on its own connection the first time it is requested and stays subscribed
+        while it is in the cache, so every new message keeps the value current.
+        Least recently requested topics get removed once the cache is full.
+        :param config: mqtt app config
+        :param client_id: client_id of the connection at the broker
+        :param client_class: mqtt client class of the engine
+        :param threaded: True if the callbacks of the client run in a different thread
+        """
+        self.config = config
+        self.size = config.get("retained_cache_size", 10000)
+        self.timeout = config.get("retained_timeout", 5)  # wait for a retained message of a new topic
+        self._cache = collections.OrderedDict()  # topic: payload, None if no message received
+        self._waiters = {}  # topic: Future of a newly subscribed topic
+        self._new = []  # topics added in this iteration of the event loop, subscribed together
+        self._loop = asyncio.get_event_loop()
+        self._started = False
+        self._isconnected = False
+        self.mqtt = client_class(client_id=client_id)
+        self.mqtt.enable_logger(log)
+        self.mqtt.username_pw_set(config["user"], config["password"])
+        if threaded:
+            self.mqtt.on_connect = lambda client, userdata, flags, rc: self._loop.call_soon_threadsafe(
+                self._connected, rc)
+            self.mqtt.on_message = lambda client, userdata, msg: self._loop.call_soon_threadsafe(
+                self._message, msg.topic, msg.payload)
+            self.mqtt.on_disconnect = lambda client, userdata, rc: self._loop.call_soon_threadsafe(
+                self._disconnected)
+        else:
+            self.mqtt.on_connect = lambda client, userdata, flags, rc: self._connected(rc)
+            self.mqtt.on_message = lambda client, userdata, msg: self._message(msg.topic, msg.payload)
+            self.mqtt.on_disconnect = lambda client, userdata, rc: self._disconnected()
+
+    def __len__(self):
+        return len(self._cache)
+
+    async def get(self, topic):
+        """
+        Get the current value of a topic. Returns immediately if the topic is cached,
+        otherwise it gets subscribed and the first message is awaited up to timeout seconds.
+        :param topic: str, no wildcards
+        :return: str or None if the topic has no retained message
+        """
+        if topic in self._cache:
+            self._cache.move_to_end(topic)
+        else:
+            self._add(topic)
+        if topic in self._waiters:
+            return await asyncio.shield(self._waiters[topic])  # shared by all requests of this topic
+        return self._cache[topic]
+
+    def _add(self, topic):
+        if not self._started:
+            self._started = True
+            # paho connects in the thread of its loop instead of blocking the event loop
+            self.mqtt.connect_async(self.config["host"], self.config["port"], self.config["keepalive"])
+            self.mqtt.loop_start()
+        self._cache[topic] = None
+        future = self._loop.create_future()
+        self._waiters[topic] = future
+        self._loop.call_later(self.timeout, self._expire, topic, future)
+        if len(self._new) == 0:
+            self._loop.call_soon(self._subscribeNew)
+        self._new.append(topic)
+        while len(self._cache) > self.size:
+            old, value = self._cache.popitem(last=False)
+            self._expire(old, self._waiters.get(old))
+            if old in self._new:
+                self._new.remove(old)
+            elif self._isconnected:
+                self.mqtt.unsubscribe(old)
+
+    def _subscribeNew(self):
+        new, self._new = self._new, []
+        if len(new) > 0 and self._isconnected:  # otherwise subscribed with all cached topics on connect
+            self.mqtt.subscribe([(topic, 0) for topic in new])  # one SUBSCRIBE packet
+
+    def _expire(self, topic, future):
+        if future is not None and self._waiters.get(topic) is future:
+            del self._waiters[topic]
+            future.set_result(None)  # no retained message, topic stays cached until a message arrives
+
+    def _message(self, topic, payload):
+        if topic not in self._cache:
+            return
+        value = payload.decode()
+        self._cache[topic] = value
+        future = self._waiters.pop(topic, None)
+        if future is not None:
+            future.set_result(value)
+
+    def _connected(self, rc):
+        if rc != 0:
+            return
+        self._isconnected = True
+        if len(self._cache) > 0:
+            # paho drops subscriptions while not connected, retained messages update the cache
+            self.mqtt.subscribe([(topic, 0) for topic in self._cache])
+
+    def _disconnected(self):
+        self._isconnected = False
+
+    def stop(self):
+        for topic in list(self._waiters):
+            self._expire(topic, self._waiters[topic])
+        if self._started:
+            self.mqtt.disconnect()
+            self.mqtt.loop_stop()
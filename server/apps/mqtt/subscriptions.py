@@ -5,23 +5,126 @@
 __updated__ = "2018-12-31"
 __version__ = "0.0"
 
-from paho.mqtt.matcher import MQTTMatcher
 
-
-def _match_topic(subscription: str, topic: str) -> bool:
-    """Test if topic matches subscription."""
-    matcher = MQTTMatcher()
-    matcher[subscription] = True
-    try:
-        next(matcher.iter_match(topic))
-        return True
-    except StopIteration:
-        return False
+class _Node:
+    __slots__ = ("children", "filter", "value")
+
+    def __init__(self):
+        self.children = {}  # topic level: _Node
+        self.filter = None  # topic filter if a filter ends at this node
+        self.value = None
+
+
+class TopicTrie:
+    """
+    Trie of mqtt topic filters, one level of the filter per node.
+    Matching a topic only follows the levels of the topic and the + and # wildcards,
+    so it takes O(topic levels) independent of the amount of filters.
+    Topics starting with $ are not matched by wildcards on the first level.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, topic_filter):
+        node = self._find(topic_filter)
+        return node is not None and node.filter is not None
+
+    def __getitem__(self, topic_filter):
+        node = self._find(topic_filter)
+        if node is None or node.filter is None:
+            raise KeyError(topic_filter)
+        return node.value
+
+    def __setitem__(self, topic_filter, value):
+        node = self._root
+        for level in topic_filter.split("/"):
+            child = node.children.get(level)
+            if child is None:
+                child = node.children[level] = _Node()
+            node = child
+        if node.filter is None:
+            self._len += 1
+            node.filter = topic_filter
+        node.value = value
+
+    def __delitem__(self, topic_filter):
+        path = []
+        node = self._root
+        for level in topic_filter.split("/"):
+            path.append((node, level))
+            node = node.children.get(level)
+            if node is None:
+                raise KeyError(topic_filter)
+        if node.filter is None:
+            raise KeyError(topic_filter)
+        node.filter = None
+        node.value = None
+        self._len -= 1
+        for parent, level in reversed(path):  # remove nodes that are not needed anymore
+            if len(node.children) > 0 or node.filter is not None:
+                break
+            del parent.children[level]
+            node = parent
+
+    def get(self, topic_filter, default=None):
+        node = self._find(topic_filter)
+        if node is None or node.filter is None:
+            return default
+        return node.value
+
+    def _find(self, topic_filter):
+        node = self._root
+        for level in topic_filter.split("/"):
+            node = node.children.get(level)
+            if node is None:
+                return None
+        return node
+
+    def iterMatch(self, topic):
+        """
+        Iterate over all filters matching a topic
+        :param topic: str
+        :return: generator of (topic filter, value)
+        """
+        levels = topic.split("/")
+        last = len(levels)
+        wildcards = not topic.startswith("$")
+        stack = [(self._root, 0)]
+        while len(stack) > 0:
+            node, i = stack.pop()
+            multi = node.children.get("#")  # also matches the parent level, "a/#" matches "a"
+            if multi is not None and multi.filter is not None and (wildcards or i > 0):
+                yield multi.filter, multi.value
+            if i == last:
+                if node.filter is not None:
+                    yield node.filter, node.value
+                continue
+            child = node.children.get(levels[i])
+            if child is not None:
+                stack.append((child, i + 1))
+            if wildcards or i > 0:
+                child = node.children.get("+")
+                if child is not None:
+                    stack.append((child, i + 1))
+
+    def items(self):
+        stack = [self._root]
+        while len(stack) > 0:
+            node = stack.pop()
+            if node.filter is not None:
+                yield node.filter, node.value
+            stack.extend(node.children.values())
 
 
 class SubscriptionHandler:
     def __init__(self, *args):
         self.subs = {}
+        self._trie = TopicTrie()  # subscription: values, same dicts as in subs
         for arg in args:
             setattr(self, "get{!s}".format(arg), self.__wrapper_get(arg))
             setattr(self, "set{!s}".format(arg), self.__wrapper_set(arg))
@@ -47,17 +150,24 @@ class SubscriptionHandler:
                 raise ValueError("Identifier does not exist: {!s}".format(identifier))
         ret = {}
         found = False
-        for sub in self.subs:
-            if _match_topic(sub, identifier):
-                found = True
-                if key in self.subs[sub]:
-                    ret[sub] = self.subs[sub][key]
+        for sub, values in self._trie.iterMatch(identifier):
+            found = True
+            if key in values:
+                ret[sub] = values[key]
         if found is False:
             raise ValueError("Identifier does not exist: {!s}".format(identifier))
         if len(ret) == 0:
             raise ValueError("Key does not exist: {!s}".format(key))
         return ret
 
+    def match(self, topic) -> dict:
+        """
+        Get all subscriptions matching a topic
+        :param topic: str
+        :return: dict, subscription: values
+        """
+        return dict(self._trie.iterMatch(topic))
+
     def getObject(self, identifier):
         if identifier in self.subs:
             return self.subs[identifier]
@@ -73,12 +183,15 @@ class SubscriptionHandler:
         if identifier in self.subs:
             raise ValueError("Identifier already exists: {!s}".format(identifier))
         self.subs[identifier] = values
+        self._trie[identifier] = values
         return values
 
     def removeObject(self, identifier):
         if identifier not in self.subs:
             raise ValueError("Identifier does not exist: {!s}".format(identifier))
         del self.subs[identifier]
+        del self._trie[identifier]
 
     def removeAll(self):
         self.subs = {}
+        self._trie = TopicTrie()
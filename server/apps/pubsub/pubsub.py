@@ -0,0 +1,203 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2019 Released under the MIT license
+# Created on 2019-03-16
+
+__updated__ = "2019-03-16"
+__version__ = "0.0"
+
+from server.apphandler.apphandler import App, AppInstance
+from server.apps.mqtt.subscriptions import TopicTrie
+from server.apps.mqtt.outbox import ConflatingOutbox, stateTopic
+from server.apphandler.client import Client as _Client
+
+# Publish/subscribe between the devices of this server without an external broker.
+# Uses the messages of the mqtt app so devices can use the same client (client/apps/pubsub.py),
+# clients receive [topic, [subscriptions], msg, retain].
+
+# COMMANDS
+CMD_PUB = 1
+CMD_SUBS = 2
+CMD_UNSUBS = 3
+CMD_WILL = 4
+CMD_WELC = 5
+
+
+class PubSubInstance(ConflatingOutbox, AppInstance):
+    # Messages for the client are conflated per topic like in the mqtt app,
+    # a slow or disconnected client does not delay the publishing client.
+
+    def __init__(self, app, id, client: _Client):
+        super().__init__(app, id, client)
+        self._initOutbox()
+        self.topics = set()  # subscribed topic filters
+        self.will = None
+        self._client_connected = True
+
+    def migrate(self, old):
+        """
+        Take over the subscriptions of the instance of the previous app version
+        :param old: PubSubInstance
+        """
+        super().migrate(old)
+        if len(self.app.retained) == 0 and old.app is not None:
+            self.app.retained.update(old.app.retained)  # first migrated instance brings the retained messages
+        for topic in old.topics:
+            self.topics.add(topic)
+            self.app.subscribe(self, topic)
+        self.will = old.will
+        self._client_connected = old._client_connected
+        self._migrateOutbox(old)
+        old.will = None  # old instance must not publish the will on stop
+        self._startSender()
+
+    def deliver(self, topic, subscriptions, msg, retain=False):
+        """
+        Called by the app for every message matching a subscription of this instance
+        :param topic: str
+        :param subscriptions: list of matching topic filters
+        :param msg: message
+        :param retain: bool, True if it is a retained message sent because of a new subscription
+        """
+        self._conflate(topic, [topic, subscriptions, msg, retain])
+
+    def _subscribe(self, topics, check_state_topic=True):
+        if type(topics) != list:
+            topics = [topics]
+        for topic in topics:
+            if topic in self.topics:
+                continue  # e.g. client resubscribing after a reconnect
+            self.topics.add(topic)
+            self.app.subscribe(self, topic)
+            for t, msg in self.app.getRetained(topic):
+                self.deliver(t, [topic], msg, True)
+            state_topic = stateTopic(topic)
+            if check_state_topic is True and state_topic is not None and state_topic in self.app.retained:
+                # current state of a command topic
+                self.deliver(state_topic, [state_topic], self.app.retained[state_topic], True)
+
+    def _unsubscribe(self, topics):
+        if type(topics) != list:
+            topics = [topics]
+        for topic in topics:
+            if topic not in self.topics:
+                self.log.warn("Unsubscribe: Topic not subscribed: {!s}".format(topic))
+                continue
+            self.topics.discard(topic)
+            self.app.unsubscribe(self, topic)
+
+    async def stop(self):
+        """
+        Remove subscriptions, publish will if the client is still connected (e.g. on shutdown)
+        :return:
+        """
+        if self._client_connected and self.will is not None:
+            self.app.publish(*self.will)
+        self._client_connected = False
+        self._unsubscribe(list(self.topics))
+        self._stopSender()
+        await super().stop()
+
+    def start(self):
+        """
+        Called after creation and when Connection to client is reestablished.
+        Subscriptions are kept while the client is disconnected, buffered messages get sent.
+        :return:
+        """
+        self._client_connected = True
+        self.log.debug("(Re)starting")
+        self._startSender()
+
+    async def pause(self):
+        """
+        Connection to client broken, publish will and buffer the newest message of each topic.
+        :return:
+        """
+        if not self._client_connected:
+            return  # already paused, e.g. stop() of the client and connection_lost both pause
+        self.log.debug("Pausing")
+        self._client_connected = False
+        if self.will is not None:
+            self.app.publish(*self.will)
+
+    async def handle(self, header_byte, data):
+        """
+        Handle new messages from client
+        :param header_byte:
+        :param data:
+        :return:
+        """
+        self.log.debug("Got header {!s}, data {!s}".format(header_byte, data))
+        if header_byte == CMD_UNSUBS:
+            self._unsubscribe(data)
+        elif header_byte == CMD_SUBS:
+            self._subscribe(*data)
+        elif header_byte == CMD_PUB:
+            self.app.publish(*data)
+        elif header_byte == CMD_WILL:
+            self.will = data
+        elif header_byte == CMD_WELC:
+            self.app.publish(*data)
+        else:
+            self.log.error("No command for header {!s}".format(header_byte))
+
+
+class PubSub(App):
+    def __init__(self, config):
+        super().__init__(config)
+        self.AppInstance = PubSubInstance
+        self.subscriptions = TopicTrie()  # topic filter: {PubSubInstance: None}
+        self.retained = {}  # topic: msg
+        self.retained_size = config.get("retained_size", 10000)
+
+    def subscribe(self, instance, topic_filter):
+        instances = self.subscriptions.get(topic_filter)
+        if instances is None:
+            instances = self.subscriptions[topic_filter] = {}
+        instances[instance] = None
+
+    def unsubscribe(self, instance, topic_filter):
+        instances = self.subscriptions.get(topic_filter)
+        if instances is None:
+            return
+        instances.pop(instance, None)
+        if len(instances) == 0:
+            del self.subscriptions[topic_filter]
+
+    def publish(self, topic, msg, retain=False):
+        """
+        Send a message to all instances subscribed to a matching topic filter
+        :param topic: str
+        :param msg: message, an empty message removes the retained message of the topic
+        :param retain: bool, keep msg for new subscriptions
+        """
+        if retain:
+            if msg is None or msg == "":
+                self.retained.pop(topic, None)
+            else:
+                self.retained.pop(topic, None)  # keeps the dict ordered by last update for eviction
+                self.retained[topic] = msg
+                if len(self.retained) > self.retained_size:
+                    del self.retained[next(iter(self.retained))]
+        targets = {}  # instance: matching topic filters
+        for topic_filter, instances in self.subscriptions.iterMatch(topic):
+            for instance in instances:
+                targets.setdefault(instance, []).append(topic_filter)
+        for instance, topic_filters in targets.items():
+            instance.deliver(topic, topic_filters, msg)
+
+    def getRetained(self, topic_filter) -> list:
+        """
+        :param topic_filter: str, wildcard filters have to check all retained topics
+        :return: list of (topic, msg)
+        """
+        if "+" not in topic_filter and "#" not in topic_filter:
+            if topic_filter in self.retained:
+                return [(topic_filter, self.retained[topic_filter])]
+            return []
+        trie = TopicTrie()
+        trie[topic_filter] = True
+        return [(topic, msg) for topic, msg in self.retained.items() if any(True for _ in trie.iterMatch(topic))]
+
+    async def stop(self):
+        """Extend with your own code but call stop method of base class to prevent RAM leak and to stop instances"""
+        await super().stop()
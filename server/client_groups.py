@@ -0,0 +1,205 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2019 Released under the MIT license
+# Created on 2019-03-02
+
+__updated__ = "2019-03-02"
+__version__ = "0.0"
+
+import logging
+
+log = logging.getLogger("ClientGroups")
+
+
+class ClientGroup:
+    """
+    Named group of client_ids.
+    A group either has a pattern like "building3/*" and contains all existing clients whose client_id starts
+    with "building3/" or an exact pattern like "building3" only matching this client_id.
+    A group without a pattern contains only client_ids that were explicitly added (these can be clients that
+    don't exist yet, like the client_ids given to a MultipleClientHelper).
+    Both can be combined, the group will then contain the added client_ids and all matching clients.
+    Membership is maintained by the GroupIndex of the Network as clients get created and removed.
+    """
+
+    def __init__(self, name, pattern=None):
+        self.name = name
+        self.pattern = pattern
+        self._static = {}  # explicitly added client_ids, dict as ordered set
+        self._matched = {}  # existing clients matching the pattern
+        self._members = {}  # client_id: 1 if static or matched, 2 if both
+        self.connected = {}  # connected members, dict as ordered set
+        self.barriers = []  # GroupConnectionBarrier waiting for members of this group
+
+    def __repr__(self):
+        return '"ClientGroup {!s}"'.format(self.name)
+
+    def __len__(self):
+        return len(self._members)
+
+    def __contains__(self, client_id):
+        return client_id in self._members
+
+    def __iter__(self):
+        return iter(self.client_ids)
+
+    @property
+    def client_ids(self) -> list:
+        return list(self._members)
+
+    def _add(self, members: dict, client_id, connected) -> bool:
+        if client_id in members:
+            return False
+        members[client_id] = None
+        self._members[client_id] = self._members.get(client_id, 0) + 1
+        if connected:
+            self.connected[client_id] = None
+        return True
+
+    def _remove(self, members: dict, client_id) -> bool:
+        if client_id not in members:
+            return False
+        del members[client_id]
+        self._members[client_id] -= 1
+        if self._members[client_id] == 0:
+            del self._members[client_id]
+            self.connected.pop(client_id, None)
+        return True
+
+    def _setConnected(self, client_id, connected):
+        if client_id not in self._members:
+            return
+        if connected:
+            self.connected[client_id] = None
+        else:
+            self.connected.pop(client_id, None)
+        self._updateBarriers()
+
+    def _updateBarriers(self):
+        for barrier in self.barriers:
+            barrier.update()
+
+
+class GroupIndex:
+    """
+    Index of all client groups of a Network.
+    Patterns are indexed by their prefix so that adding or removing a client only needs one dict lookup
+    per distinct prefix length instead of checking every group.
+    """
+
+    def __init__(self, clients: dict):
+        self._clients = clients  # Network.clients
+        self.groups = {}  # name: ClientGroup
+        self._static = {}  # client_id: [ClientGroup]
+        self._exact = {}  # exact pattern: [ClientGroup]
+        self._prefixes = {}  # prefix: [ClientGroup]
+        self._prefix_lengths = {}  # len(prefix): amount of prefixes with that length
+
+    def addGroup(self, name, pattern=None, client_ids=None) -> ClientGroup:
+        """
+        Create a new group.
+        :param name: str, unique group name
+        :param pattern: str, "<prefix>*" to match all client_ids starting with prefix, otherwise exact client_id
+        :param client_ids: list of client_ids to add explicitly
+        :return: ClientGroup
+        """
+        if name in self.groups:
+            raise ValueError("Group {!s} already exists".format(name))
+        group = ClientGroup(name, pattern)
+        self.groups[name] = group
+        if pattern is not None:
+            if pattern.endswith("*"):
+                prefix = pattern[:-1]
+                self._prefixes.setdefault(prefix, []).append(group)
+                self._prefix_lengths[len(prefix)] = self._prefix_lengths.get(len(prefix), 0) + 1
+                for client_id in self._clients:
+                    if client_id.startswith(prefix):
+                        group._add(group._matched, client_id, self._isConnected(client_id))
+            else:
+                self._exact.setdefault(pattern, []).append(group)
+                if pattern in self._clients:
+                    group._add(group._matched, pattern, self._isConnected(pattern))
+        if client_ids is not None:
+            for client_id in client_ids:
+                self.addToGroup(name, client_id)
+        return group
+
+    def removeGroup(self, name):
+        group = self.getGroup(name)
+        for client_id in group._static:
+            self._static[client_id].remove(group)
+            if len(self._static[client_id]) == 0:
+                del self._static[client_id]
+        if group.pattern is not None:
+            if group.pattern.endswith("*"):
+                prefix = group.pattern[:-1]
+                self._prefixes[prefix].remove(group)
+                if len(self._prefixes[prefix]) == 0:
+                    del self._prefixes[prefix]
+                self._prefix_lengths[len(prefix)] -= 1
+                if self._prefix_lengths[len(prefix)] == 0:
+                    del self._prefix_lengths[len(prefix)]
+            else:
+                self._exact[group.pattern].remove(group)
+                if len(self._exact[group.pattern]) == 0:
+                    del self._exact[group.pattern]
+        del self.groups[name]
+
+    def getGroup(self, name) -> ClientGroup:
+        if name not in self.groups:
+            raise IndexError("Group {!s} does not exist".format(name))
+        return self.groups[name]
+
+    def addToGroup(self, name, client_id):
+        group = self.getGroup(name)
+        if group._add(group._static, client_id, self._isConnected(client_id)):
+            self._static.setdefault(client_id, []).append(group)
+            group._updateBarriers()
+
+    def removeFromGroup(self, name, client_id):
+        group = self.getGroup(name)
+        if not group._remove(group._static, client_id):
+            raise ValueError("Client {!s} not explicitly added to group {!s}".format(client_id, name))
+        self._static[client_id].remove(group)
+        if len(self._static[client_id]) == 0:
+            del self._static[client_id]
+        group._updateBarriers()
+
+    def getGroupsOfClient(self, client_id) -> list:
+        """
+        Returns all groups a client_id is member of.
+        :param client_id: str
+        :return: list of ClientGroup
+        """
+        groups = list(self._static.get(client_id, ()))
+        for group in self._matching(client_id):
+            if group not in groups:
+                groups.append(group)
+        return groups
+
+    def _matching(self, client_id):
+        for group in self._exact.get(client_id, ()):
+            yield group
+        for length in self._prefix_lengths:
+            if length <= len(client_id):
+                for group in self._prefixes.get(client_id[:length], ()):
+                    yield group
+
+    def _isConnected(self, client_id) -> bool:
+        return client_id in self._clients and self._clients[client_id].connected.is_set()
+
+    def clientAdded(self, client_id):
+        """Called by Network when a client object got created"""
+        for group in self._matching(client_id):
+            if group._add(group._matched, client_id, self._isConnected(client_id)):
+                group._updateBarriers()
+
+    def clientRemoved(self, client_id):
+        """Called by Network when a client object got removed"""
+        for group in self._matching(client_id):
+            if group._remove(group._matched, client_id):
+                group._updateBarriers()
+
+    def clientConnectionChanged(self, client_id, connected):
+        """Called by Network when a client connected or disconnected"""
+        for group in self.getGroupsOfClient(client_id):
+            group._setConnected(client_id, connected)
@@ -0,0 +1,75 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2019 Released under the MIT license
+# Created on 2019-03-03
+
+__updated__ = "2019-03-03"
+__version__ = "0.0"
+
+import asyncio
+import math
+
+
+class ConnectionBarrier:
+    """
+    Counts how many of the given clients are connected.
+    The counter is updated by the Network on every connection change of one of the clients,
+    waiting coroutines only get woken up once the barrier is reached.
+    """
+
+    def __init__(self, client_ids, n=None):
+        """
+        :param client_ids: iterable of client_ids
+        :param n: int, amount of connected clients needed, defaults to all clients
+        """
+        self.client_ids = list(dict.fromkeys(client_ids))
+        self.n = n
+        self.count = 0
+        self._reached = asyncio.Event()
+
+    @property
+    def target(self) -> int:
+        return len(self.client_ids) if self.n is None else self.n
+
+    @property
+    def reached(self) -> bool:
+        return self._reached.is_set()
+
+    def update(self, delta=0):
+        """
+        :param delta: change of the amount of connected clients
+        """
+        self.count += delta
+        if self.count >= self.target:
+            self._reached.set()
+        else:
+            self._reached.clear()
+
+    async def wait(self, timeout=math.inf):
+        """
+        Wait until the barrier is reached.
+        :param timeout: float
+        :return: True, TimeoutError on timeout
+        """
+        if timeout is None or timeout == math.inf:
+            timeout = None
+        try:
+            await asyncio.wait_for(self._reached.wait(), timeout)
+        except asyncio.TimeoutError:
+            raise asyncio.TimeoutError("Timeout waiting for client connections")
+        return True
+
+
+class GroupConnectionBarrier(ConnectionBarrier):
+    """Counts the connected members of a ClientGroup, the target follows the group size if n is None"""
+
+    def __init__(self, group, n=None):
+        super().__init__((), n)
+        self.group = group
+
+    @property
+    def target(self) -> int:
+        return len(self.group) if self.n is None else self.n
+
+    def update(self, delta=0):
+        self.count = len(self.group.connected)
+        super().update()
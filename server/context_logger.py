@@ -0,0 +1,33 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2019 Released under the MIT license
+# Created on 2019-03-06
+
+__updated__ = "2019-03-06"
+__version__ = "0.0"
+
+import logging
+
+
+class ContextLogger(logging.LoggerAdapter):
+    """
+    Logger adapter prefixing every message with a context like the client_id.
+    Used for short-lived objects instead of creating a named logger for each of them,
+    as the logging module never frees loggers once they are created.
+    """
+
+    def __init__(self, logger: logging.Logger, context):
+        super().__init__(logger, {"context": context})
+
+    @property
+    def context(self):
+        return self.extra["context"]
+
+    @context.setter
+    def context(self, context):
+        self.extra["context"] = context
+
+    def process(self, msg, kwargs):
+        return "[{!s}] {!s}".format(self.extra["context"], msg), kwargs
+
+    def warn(self, msg, *args, **kwargs):
+        self.warning(msg, *args, **kwargs)
@@ -0,0 +1,113 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2019 Released under the MIT license
+# Created on 2019-03-04
+
+__updated__ = "2019-03-04"
+__version__ = "0.0"
+
+import array
+import math
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None  # queries fall back to plain loops over the arrays
+
+
+class FleetTable:
+    """
+    Columnar mirror of the state of all Client objects of a Network.
+    Every client gets a dense slot that indexes the columns, slots of removed clients get reused.
+    Columns are array module arrays so fleet-wide queries don't need to touch every Client object.
+    If numpy is available, queries are vectorised on a view of the arrays.
+    Times are stored as float timestamps, NaN if not set (e.g. client never connected or slot unused).
+    """
+
+    def __init__(self):
+        self.client_ids = []  # slot: client_id, None if slot is unused
+        self.connected = array.array("b")
+        self.last_rx_time = array.array("d")
+        self.last_connection_time = array.array("d")
+        self._slots = {}  # client_id: slot
+        self._free = []
+
+    def __len__(self):
+        return len(self._slots)
+
+    def addClient(self, client) -> int:
+        """
+        Assign a slot to a client and initialize it with the current state of the client
+        :param client: Client
+        :return: slot
+        """
+        if client.client_id in self._slots:
+            return self._slots[client.client_id]
+        if len(self._free) > 0:
+            slot = self._free.pop()
+            self.client_ids[slot] = client.client_id
+        else:
+            slot = len(self.client_ids)
+            self.client_ids.append(client.client_id)
+            self.connected.append(0)
+            self.last_rx_time.append(math.nan)
+            self.last_connection_time.append(math.nan)
+        self._slots[client.client_id] = slot
+        self.connected[slot] = 1 if client.connected.is_set() else 0
+        self.last_rx_time[slot] = math.nan if client.last_rx_time is None else client.last_rx_time
+        t = client.last_connection_time
+        self.last_connection_time[slot] = math.nan if t is None else t
+        return slot
+
+    def removeClient(self, client_id):
+        slot = self._slots.pop(client_id, None)
+        if slot is None:
+            return
+        self.client_ids[slot] = None
+        self.connected[slot] = 0
+        self.last_rx_time[slot] = math.nan
+        self.last_connection_time[slot] = math.nan
+        self._free.append(slot)
+
+    def getSlot(self, client_id) -> int:
+        return self._slots[client_id]
+
+    def countConnected(self) -> int:
+        if numpy is not None:
+            return int(numpy.count_nonzero(numpy.frombuffer(self.connected, dtype=numpy.int8)))
+        return sum(self.connected)
+
+    def getConnected(self) -> list:
+        """
+        :return: list of client_ids of all connected clients
+        """
+        if numpy is not None:
+            slots = numpy.flatnonzero(numpy.frombuffer(self.connected, dtype=numpy.int8))
+            return [self.client_ids[slot] for slot in slots]
+        return [self.client_ids[slot] for slot, c in enumerate(self.connected) if c]
+
+    def silentSince(self, seconds, now=None) -> list:
+        """
+        Returns all clients that did not send anything for the given amount of seconds.
+        Clients that never sent anything are not included.
+        :param seconds: float
+        :param now: float, timestamp to compare to, defaults to time.time()
+        :return: list of client_ids
+        """
+        return self._olderThan(self.last_rx_time, (time.time() if now is None else now) - seconds)
+
+    def connectedBefore(self, seconds, now=None) -> list:
+        """
+        Returns all clients whose last connection was established more than the given amount of seconds ago.
+        :param seconds: float
+        :param now: float, timestamp to compare to, defaults to time.time()
+        :return: list of client_ids
+        """
+        return self._olderThan(self.last_connection_time, (time.time() if now is None else now) - seconds)
+
+    def _olderThan(self, column, timestamp) -> list:
+        # NaN never compares True so unused slots and unset times are excluded
+        if numpy is not None:
+            slots = numpy.flatnonzero(numpy.frombuffer(column, dtype=numpy.float64) < timestamp)
+            return [self.client_ids[slot] for slot in slots]
+        return [self.client_ids[slot] for slot, t in enumerate(column) if t < timestamp]
@@ -10,6 +10,7 @@ import asyncio
 import math
 
 from server.server_generic import getNetwork as _getNetwork
+from server.context_logger import ContextLogger
 import logging
 
 log = logging.getLogger("Client")
@@ -76,9 +77,10 @@ class Client:
         self._removed = False  # if object has been removed. Will raise errors if tried to access.
         self.timeout_client = timeout_client_object
         self.timeout_connection = timeout_connection
-        self.last_connection_time = None  # Client can be created without an active connection
-        self.last_rx_time = None
-        self.log = logging.getLogger("{!s}".format(self))
+        self._fleet_slot = None  # slot in Network.fleet, set by Network once the client is added
+        self._last_connection_time = None  # Client can be created without an active connection
+        self._last_rx_time = None
+        self.log = ContextLogger(log, self.client_id)
         self.log.debug("Client created")
 
     def __str__(self):
@@ -87,6 +89,26 @@ class Client:
     def __repr__(self):
         return '"Client {!s}"'.format(self.client_id)
 
+    @property
+    def last_rx_time(self):
+        return self._last_rx_time
+
+    @last_rx_time.setter
+    def last_rx_time(self, value):
+        self._last_rx_time = value
+        if self._fleet_slot is not None:
+            _getNetwork().fleet.last_rx_time[self._fleet_slot] = value
+
+    @property
+    def last_connection_time(self):
+        return self._last_connection_time
+
+    @last_connection_time.setter
+    def last_connection_time(self, value):
+        self._last_connection_time = value
+        if self._fleet_slot is not None:
+            _getNetwork().fleet.last_connection_time[self._fleet_slot] = value
+
     @classmethod
     def readID(cls, message: bytes) -> str:
         """
@@ -112,32 +134,22 @@ class Client:
 
     # @_checkRemovedAsync
     async def awaitConnection(self, timeout=math.inf):
-        if timeout is None:
-            timeout = math.inf
         if self.client_id is None:
             raise ValueError("Can't wait for client with id None")
-        st = time.time()
-        while time.time() - st < timeout:
-            while self.client_id in _getNetwork().clients:
-                if time.time() - st > timeout:
-                    break
-                try:
-                    await asyncio.wait_for(_getNetwork().clients[self.client_id].connected.wait(), 1)
-                except asyncio.TimeoutError:
-                    continue
-                return True
-            while self.client_id not in _getNetwork().clients:
-                if time.time() - st > timeout:
-                    break
-                try:
-                    await asyncio.wait_for(_getNetwork().new_client.wait(), 1)
-                except asyncio.TimeoutError:
-                    continue
-        raise asyncio.TimeoutError("Timeout waiting for client connection")
+        return await _getNetwork().awaitConnections([self.client_id], timeout=timeout)
+
+    def _setConnected(self, connected):
+        if connected == self.connected.is_set():
+            return
+        if connected:
+            self.connected.set()
+        else:
+            self.connected.clear()
+        _getNetwork().clientConnectionChanged(self, connected)
 
     async def _await_removal(self):
         self.log.debug("Awaiting removal")
-        self.connected.clear()
+        self._setConnected(False)
         if self.timeout_client == math.inf:
             self.log.debug("Client is persistent, won't remove")
             return  # won't remove Client object
@@ -153,16 +165,13 @@ class Client:
         self.closing.set()
         await asyncio.sleep(3)  # give apps time to receive and process information
         self.log.debug("Client removed from client list")
-        try:
-            _getNetwork().clients.pop(self.client_id)
-        except KeyError:
-            pass
+        _getNetwork().removeClient(self.client_id)
         # self.log.debug("Client list: {!s}".format(_getNetwork().clients))
         self._removed = True
 
     # @_checkRemoved
     async def stop(self):
-        self.connected.clear()
+        self._setConnected(False)
         if self.closing.is_set() is False:
             self.log.debug("Cancelling all tasks")
             if self.await_client_timeout_task is None or self.await_client_timeout_task.done():
@@ -197,10 +206,7 @@ class Client:
                 self.await_client_timeout_task.cancel()
             await asyncio.sleep(3)
             await self.stop()
-            try:
-                _getNetwork().clients.pop(self.client_id)
-            except KeyError:
-                pass
+            _getNetwork().removeClient(self.client_id)
             # self.log.debug("Client list: {!s}".format(_getNetwork().clients))
             self._removed = True
             return
@@ -217,7 +223,7 @@ class Client:
         self.last_connection_time = time.time()
         self.last_rx_time = time.time()
         self.new_message_rx.clear()
-        self.connected.set()
+        self._setConnected(True)
         if self.await_client_timeout_task is not None:
             self.await_client_timeout_task.cancel()
         if self.keepalive_task is None or self.keepalive_task.done():
@@ -237,6 +243,14 @@ class Client:
         """
         return (await self._read(timeout, only_with_connection)).decode()
 
+    def _unread(self, message):
+        """
+        Put a message returned by read() back to the front of the receive buffer
+        :param message: message as returned by read()
+        """
+        self.lines_received.insert(0, message.encode())
+        self.new_message_rx.set()
+
     async def _read(self, timeout, only_with_connection) -> bytes:
         """
         Reads one message. Awaits until timeout.
@@ -306,19 +320,23 @@ class Client:
                 except asyncio.TimeoutError:
                     continue
                 else:
-                    self.output_buffer.append(message)
-                    self.new_message_tx.set()
-                    while len(self.output_buffer) > self.len_tx_buffer:
-                        self.output_buffer.pop(0)
+                    self._bufferMessage(message)
                     return True
             else:
-                self.output_buffer.append(message)
-                self.new_message_tx.set()
-                while len(self.output_buffer) > self.len_tx_buffer:
-                    self.output_buffer.pop(0)
+                self._bufferMessage(message)
                 return True
         return False
 
+    def _bufferMessage(self, message):
+        """
+        Add an already newline terminated message to the output buffer.
+        :param message: str/bytes
+        """
+        self.output_buffer.append(message)
+        self.new_message_tx.set()
+        while len(self.output_buffer) > self.len_tx_buffer:
+            self.output_buffer.pop(0)
+
     def __del__(self):
         try:
             self.log.debug("Removing client object")
@@ -12,6 +12,7 @@ import math
 
 from server.server_generic import getNetwork as _getNetwork
 from server.generic_clients.client import Client, ClientRemovedException
+from server.client_groups import ClientGroup
 
 log = logging.getLogger("ClientHelpers")
 
@@ -23,13 +24,43 @@ def getClient(client_id, *args, **kwargs) -> Client:
         return _getNetwork().clients[client_id]
     client = Client(client_id, *args, **kwargs)
     # basically a future client object without a transport/socket
-    _getNetwork().clients[client_id] = client
+    _getNetwork().addClient(client)
     return client
 
 
 class MultipleClientHelper:
     def __init__(self, client_ids: list):
-        self.client_ids = client_ids if type(client_ids) == list else [client_ids]
+        """
+        :param client_ids: list of client_ids, a single client_id or a ClientGroup.
+        If a ClientGroup is given, all methods target the current members of the group.
+        """
+        self.group = None
+        self._client_ids = None
+        self.client_ids = client_ids
+
+    @classmethod
+    def fromGroup(cls, name):
+        """
+        Create a helper targeting the group with the given name
+        :param name: name of a group created with Network.groups.addGroup()
+        :return: MultipleClientHelper
+        """
+        return cls(_getNetwork().groups.getGroup(name))
+
+    @property
+    def client_ids(self) -> list:
+        if self.group is not None:
+            return self.group.client_ids
+        return self._client_ids
+
+    @client_ids.setter
+    def client_ids(self, client_ids):
+        if isinstance(client_ids, ClientGroup):
+            self.group = client_ids
+            self._client_ids = None
+        else:
+            self.group = None
+            self._client_ids = client_ids if type(client_ids) == list else [client_ids]
 
     @staticmethod
     def _clientsInList(client_ids):
@@ -45,44 +76,20 @@ class MultipleClientHelper:
         else:
             raise IndexError("Client does not exist")
 
-    async def awaitConnection(self, timeout=math.inf):
-        if timeout is None:
-            timeout = math.inf
-        st = time.time()
-        while time.time() - st < timeout:
-            if self._clientsInList(self.client_ids):
-                tasks = []
-                for client_id in self.client_ids:
-                    tasks.append(_getNetwork().clients[client_id].connected.wait())
-                try:
-                    await asyncio.wait_for(asyncio.gather(*tasks), 1)
-                except asyncio.TimeoutError:
-                    continue
-                return True
-            else:
-                try:
-                    await asyncio.wait_for(_getNetwork().new_client.wait(), 1)
-                except asyncio.TimeoutError:
-                    continue
-        raise asyncio.TimeoutError("Timeout waiting for client connections")
+    async def awaitConnection(self, timeout=math.inf, n=None):
+        """
+        Wait until the clients are connected.
+        :param timeout: float
+        :param n: int, amount of connected clients needed, defaults to all clients
+        :return: True, TimeoutError on timeout
+        """
+        if self.group is not None:
+            return await _getNetwork().awaitGroupConnection(self.group.name, n, timeout)
+        return await _getNetwork().awaitConnections(self.client_ids, n, timeout)
 
     async def _awaitConnection(self, client_id, timeout=math.inf):
-        if timeout is None:
-            timeout = math.inf
-        st = time.time()
-        while time.time() - st < timeout:
-            if self._clientsInList(client_id):
-                try:
-                    await asyncio.wait_for(_getNetwork().clients[client_id].connected.wait(), 1)
-                except asyncio.TimeoutError:
-                    continue
-                return True
-            else:
-                try:
-                    await asyncio.wait_for(_getNetwork().new_client.wait(), 1)
-                except asyncio.TimeoutError:
-                    continue
-        raise asyncio.TimeoutError("Timeout waiting for client connection")
+        return await _getNetwork().awaitConnections(client_id if type(client_id) == list else [client_id],
+                                                    timeout=timeout)
 
     async def readClient(self, client_id, timeout=math.inf, only_with_connection=False):
         if timeout is None:
@@ -126,6 +133,56 @@ class MultipleClientHelper:
         res = await asyncio.gather(*tasks)
         return res
 
+    async def readAsCompleted(self, timeout=math.inf, quorum=None, only_with_connection=False):
+        """
+        Async generator yielding (client_id, message) as soon as a message of a client arrives.
+        Reads one message of every client, like readAll, but doesn't wait for the slowest client.
+        Iteration ends when every client delivered a message, the timeout expired
+        or at least quorum messages were received.
+        Clients that don't exist yet will be ignored. Messages already read when the iteration stops
+        are put back into the buffer of their client.
+        Usage: async for client_id, message in helper.readAsCompleted(timeout=5, quorum=3):
+        :param timeout: float, overall deadline for all messages
+        :param quorum: int, stop after this amount of messages
+        :param only_with_connection: bool
+        :return: async generator of (client_id, message)
+        """
+        if timeout is None:
+            timeout = math.inf
+        deadline = time.time() + timeout
+        tasks = {}
+        clients = _getNetwork().clients
+        for client_id in self.client_ids:
+            client = clients.get(client_id)
+            if client is None:
+                continue  # client does not exist yet
+            tasks[asyncio.ensure_future(client.read(timeout, only_with_connection))] = client
+        received = 0
+        try:
+            while len(tasks) > 0 and (quorum is None or received < quorum):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                done, _ = await asyncio.wait(list(tasks), timeout=None if remaining == math.inf else remaining,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if quorum is not None and received >= quorum:
+                        break  # remaining results stay in tasks and are put back in the finally block
+                    client = tasks.pop(task)
+                    try:
+                        message = task.result()
+                    except (IndexError, asyncio.TimeoutError, ClientRemovedException):
+                        continue
+                    received += 1
+                    yield client.client_id, message
+        finally:
+            for task in tasks:
+                if task.done():
+                    if not task.cancelled() and task.exception() is None:
+                        tasks[task]._unread(task.result())
+                else:
+                    task.cancel()
+
     async def writeAll(self, message, timeout=math.inf, only_with_connection=False, qos=True):
         """
         Write to all clients of this object the same message.
@@ -155,6 +212,30 @@ class MultipleClientHelper:
         res = await asyncio.gather(*tasks)
         return res
 
+    async def broadcast(self, message, only_with_connection=False):
+        """
+        Write the same message to all clients of this object in one pass.
+        The message is encoded only once and put into the buffer of every existing client.
+        Clients that don't exist yet will not receive the message.
+        :param message: str/bytes
+        :param only_with_connection: bool, only write to currently connected clients
+        :return: list, [ [<client_id>, bool], ...], True/False: message success
+        """
+        if type(message) == str:
+            message = message.encode()
+        if not message.endswith(b"\n"):
+            message += b"\n"
+        clients = _getNetwork().clients
+        res = []
+        for client_id in self.client_ids:
+            client = clients.get(client_id)
+            if client is None or client.removed or (only_with_connection and not client.connected.is_set()):
+                res.append([client_id, False])
+                continue
+            client._bufferMessage(message)
+            res.append([client_id, True])
+        return res
+
     async def writeClient(self, client_id, message, timeout=math.inf, only_with_connection=False, qos=True):
         """
         Write to the client at client_id.
@@ -222,27 +303,9 @@ class ClientHelper:
 
     @staticmethod
     async def awaitConnection(client_ids: list, timeout=math.inf):
-        if timeout is None:
-            timeout = math.inf
         if type(client_ids) != list:
             client_ids = [client_ids]
-        st = time.time()
-        while time.time() - st < timeout:
-            if ClientHelper._clientsInList(client_ids):
-                tasks = []
-                for client_id in client_ids:
-                    tasks.append(_getNetwork().clients[client_id].connected.wait())
-                try:
-                    await asyncio.wait_for(asyncio.gather(*tasks), 1)
-                except asyncio.TimeoutError:
-                    continue
-                return True
-            else:
-                try:
-                    await asyncio.wait_for(_getNetwork().new_client.wait(), 1)
-                except asyncio.TimeoutError:
-                    continue
-        raise asyncio.TimeoutError("Timeout waiting for client connection")
+        return await _getNetwork().awaitConnections(client_ids, timeout=timeout)
 
     async def read(self, client_id, timeout=math.inf, only_with_connection=False):
         if timeout is None:
@@ -24,7 +24,8 @@ from server.apphandler import clients
 from server.server_generic import Network
 
 n = Network(timeout_client_object=30,
-            client_class=clients.Client)  # for debug purposes only hold client object for 30s
+            client_class=clients.Client,
+            warmup_apps=True)  # for debug purposes only hold client object for 30s
 
 
 # TODO: add example for temporary app that deletes itself after answering the request
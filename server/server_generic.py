@@ -10,6 +10,9 @@ import logging
 import math
 import time
 from server.apphandler.apphandler import AppHandler
+from server.client_groups import GroupIndex
+from server.connection_barrier import ConnectionBarrier, GroupConnectionBarrier
+from server.fleet_table import FleetTable
 
 # server tested with 800 concurrent (dis)connects at a time, sending one message,
 # causing ~70% cpu usage on one 2GHz arm core with ~40MB RAM usage.
@@ -30,7 +33,7 @@ def getNetwork():
 
 class Network:
     def __init__(self, hostname=None, port=None, timeout_connection=1500, timeout_client_object=3600,
-                 cb_new_client=None, client_class=None):
+                 cb_new_client=None, client_class=None, warmup_apps=False):
         """
         :param hostname: hostname to listen to, defaults to 0.0.0.0
         :param port: port is actually needed, but defaults to 8888
@@ -38,6 +41,8 @@ class Network:
         If no keepalive was possible during that time, connection will be closed
         :param timeout_client_object: timeout in s of the client object that survives a connection loss.
         The client object containing any apps and not yet sent messages will be deleted
+        :param warmup_apps: import and start all apps activated in apps.yaml before accepting connections
+        (only used with the apphandler client)
         """
         if timeout_client_object is None:
             timeout_client_object = math.inf
@@ -55,9 +60,13 @@ class Network:
         self.server = None
         self.server_task = None
         self.clients = {}
+        self.groups = GroupIndex(self.clients)
+        self._barriers = {}  # client_id: [ConnectionBarrier]
+        self.fleet = FleetTable()  # columnar client state for fleet-wide queries
         self.shutdown_requested = asyncio.Event()
         self.new_client = asyncio.Event()
         self.cb_new_client = cb_new_client
+        self.warmup_apps = warmup_apps
         global _network
         _network = self
         if client_class is None:
@@ -66,14 +75,101 @@ class Network:
         else:
             self.Client = client_class
 
+    def addClient(self, client):
+        """
+        Add a new client object to the client list. Use this instead of modifying the client list directly
+        so that all indexes get updated.
+        :param client: Client
+        """
+        self.clients[client.client_id] = client
+        client._fleet_slot = self.fleet.addClient(client)
+        self.groups.clientAdded(client.client_id)
+
+    def removeClient(self, client_id):
+        """
+        Remove a client object from the client list
+        :param client_id: str
+        :return: removed Client or None if it did not exist
+        """
+        client = self.clients.pop(client_id, None)
+        if client is not None:
+            self.fleet.removeClient(client_id)
+            client._fleet_slot = None
+            self.groups.clientRemoved(client_id)
+        return client
+
+    def clientConnectionChanged(self, client, connected):
+        """
+        Called by the Client object every time its connection state changes
+        :param client: Client
+        :param connected: bool
+        """
+        if client._fleet_slot is not None:
+            self.fleet.connected[client._fleet_slot] = 1 if connected else 0
+        delta = 1 if connected else -1
+        for barrier in self._barriers.get(client.client_id, ()):
+            barrier.update(delta)
+        self.groups.clientConnectionChanged(client.client_id, connected)
+
+    async def awaitConnections(self, client_ids, n=None, timeout=math.inf):
+        """
+        Wait until n of the given clients are connected. Clients don't need to exist yet.
+        :param client_ids: list of client_ids
+        :param n: int, defaults to all clients
+        :param timeout: float
+        :return: True, TimeoutError on timeout
+        """
+        barrier = ConnectionBarrier(client_ids, n)
+        for client_id in barrier.client_ids:
+            if client_id in self.clients and self.clients[client_id].connected.is_set():
+                barrier.count += 1
+        barrier.update()
+        if barrier.reached:
+            return True
+        for client_id in barrier.client_ids:
+            self._barriers.setdefault(client_id, []).append(barrier)
+        try:
+            return await barrier.wait(timeout)
+        finally:
+            for client_id in barrier.client_ids:
+                self._barriers[client_id].remove(barrier)
+                if len(self._barriers[client_id]) == 0:
+                    del self._barriers[client_id]
+
+    async def awaitGroupConnection(self, name, n=None, timeout=math.inf):
+        """
+        Wait until n members of the group are connected.
+        :param name: group name
+        :param n: int, defaults to all current members of the group
+        :param timeout: float
+        :return: True, TimeoutError on timeout
+        """
+        group = self.groups.getGroup(name)
+        barrier = GroupConnectionBarrier(group, n)
+        barrier.update()
+        if barrier.reached:
+            return True
+        group.barriers.append(barrier)
+        try:
+            return await barrier.wait(timeout)
+        finally:
+            group.barriers.remove(barrier)
+
     async def shutdown(self):
         log.info("Shutting down network")
         self.shutdown_requested.set()
         AppHandler.stop_event.set()
         await asyncio.sleep(5)  # time for clients to shut down
+        AppHandler.shutdownExecutors()
         self.server.close()
 
     async def init(self, loop):
+        from server.apphandler.client import Client as AppHandlerClient
+        if issubclass(self.Client, AppHandlerClient):
+            AppHandler.loadRegistry()
+            asyncio.ensure_future(AppHandler.watchRegistry())
+            if self.warmup_apps:
+                await AppHandler.warmup()
         self.server = await loop.create_server(lambda: ClientConnection(self), self.hostname, self.port)
         log.info("Server created")
         self.loop = loop
@@ -159,7 +255,7 @@ class ClientConnection(asyncio.Protocol):
             client = _network.Client(self.client_id, timeout_connection=self.network.timeout_connection,
                                      timeout_client_object=self.network.timeout_client)
             client.transport = self
-            self.network.clients[self.client_id] = client
+            self.network.addClient(client)
             self.client = client
             # log.debug("Client list on creation: {!s}".format(self.network.clients))
             if self.network.cb_new_client is not None: